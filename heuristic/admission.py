@@ -0,0 +1,101 @@
+#admission control: ограничение находок в обработке + очередь с приоритетами
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Optional
+
+from config import Config
+
+# класс приоритета из заголовка X-Priority -> место в очереди (меньше - раньше)
+PRIORITIES = {
+    "interactive": 0,  # pre-commit и прочие проверки, которых ждёт человек
+    "default": 1,
+    "bulk": 2,  # ночные отчёты, бэкфиллы
+}
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int = Config.RETRY_AFTER):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Пускает запрос, пока суммарно в обработке не больше max_inflight
+    находок. Остальные ждут в очереди (не больше max_queued находок) в
+    порядке (приоритет, время прихода); не дождавшиеся за timeout получают отказ.
+
+    Ожидание идёт в event loop воркера, а не в потоке пула: ждущие запросы
+    не занимают потоки, и interactive-запрос доходит до очереди сразу,
+    сколько бы bulk-запросов в ней ни стояло."""
+
+    def __init__(
+        self,
+        max_inflight: int = Config.MAX_INFLIGHT_FINDINGS,
+        max_queued: int = Config.MAX_QUEUED_FINDINGS,
+        timeout: float = Config.ADMISSION_TIMEOUT
+    ):
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.inflight = 0
+        self.queued = 0
+        self._waiters = []  # heap: (priority, seq, cost)
+        self._seq = itertools.count()
+        self._cond = asyncio.Condition()
+
+    def _cost(self, n: int) -> int:
+        # запрос больше лимита целиком всё равно пускаем, но только в одиночку
+        return min(n, self.max_inflight)
+
+    async def acquire(self, n: int, priority: str = "default", timeout: Optional[float] = None) -> int:
+        """Ждёт места под n находок; возвращает долю, которую надо отдать в release()."""
+        cost = self._cost(n)
+        priority = PRIORITIES.get(priority, PRIORITIES["default"])
+        timeout = self.timeout if timeout is None else timeout
+        async with self._cond:
+            if not self._waiters and self.inflight + cost <= self.max_inflight:
+                self.inflight += cost
+                return cost
+
+            if self.queued + cost > self.max_queued:
+                raise AdmissionRejected("очередь переполнена")
+
+            entry = (priority, next(self._seq), cost)
+            heapq.heappush(self._waiters, entry)
+            self.queued += cost
+            deadline = time.monotonic() + timeout
+            try:
+                while not (self._waiters[0] is entry and self.inflight + cost <= self.max_inflight):
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        raise AdmissionRejected("превышено время ожидания в очереди")
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), left)
+                    except asyncio.TimeoutError:
+                        pass
+                heapq.heappop(self._waiters)
+                self.inflight += cost
+                return cost
+            except BaseException:
+                # отказ по времени или клиент отключился (отмена задачи)
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                raise
+            finally:
+                self.queued -= cost
+                # голова очереди могла смениться - пусть следующие проверят
+                self._cond.notify_all()
+
+    async def release(self, cost: int):
+        async with self._cond:
+            self.inflight -= cost
+            self._cond.notify_all()
+
+    def snapshot(self):
+        # поля меняются только в event loop, чтение целых чисел атомарно
+        return {"inflight": self.inflight, "queued": self.queued, "waiting_requests": len(self._waiters)}
+
+
+controller = AdmissionController()
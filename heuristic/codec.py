@@ -0,0 +1,102 @@
+#компактное хранение строк classifications
+# features: JSON [[feature_id, value], ...] вместо {"имя": value}
+# matched: битовая маска по id эвристик (BLOB, little-endian)
+# id -> имя берётся из версии codec_map, записанной в строке (codec_version);
+# длинный текст сжимается zlib и хранится как BLOB
+import json
+import zlib
+from typing import Dict, Any, List, Optional
+
+from config import Config
+
+
+def compress_text(value: Optional[str]):
+    if value is None:
+        return None
+    raw = value.encode("utf-8")
+    if len(raw) < Config.COMPRESS_MIN_BYTES:
+        return value
+    packed = zlib.compress(raw, 6)
+    return packed if len(packed) < len(raw) else value
+
+
+def decompress_text(value) -> Optional[str]:
+    # строки TEXT хранятся как есть, BLOB - всегда сжатый текст
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode("utf-8")
+    return value
+
+
+def ids_to_mask(ids: List[int]) -> bytes:
+    mask = 0
+    for i in ids:
+        mask |= 1 << i
+    return mask.to_bytes((mask.bit_length() + 7) // 8 or 1, "little")
+
+
+def mask_to_ids(mask: Optional[bytes]) -> List[int]:
+    if not mask:
+        return []
+    n = int.from_bytes(mask, "little")
+    return [i for i in range(n.bit_length()) if n >> i & 1]
+
+
+def mask_any(mask: Optional[bytes], ids_json: str) -> int:
+    """SQL-функция: есть ли в маске хоть один id из JSON-списка."""
+    if not mask:
+        return 0
+    n = int.from_bytes(mask, "little")
+    return int(any(n >> i & 1 for i in json.loads(ids_json)))
+
+
+def build_map(
+    version: int,
+    features: Dict[int, str],
+    heuristics: Dict[int, str],
+    weights: Optional[Dict[int, float]] = None
+) -> Dict[str, Any]:
+    heuristic_ids: Dict[str, List[int]] = {}
+    for hid in sorted(heuristics):
+        heuristic_ids.setdefault(heuristics[hid], []).append(hid)
+    return {
+        "version": version,
+        "features": features,
+        "heuristics": heuristics,
+        "weights": weights,  # None - версия записана до того, как веса стали сохраняться
+        "feature_ids": {name: fid for fid, name in features.items()},
+        "heuristic_ids": heuristic_ids,
+    }
+
+
+def encode_features(features: Dict[str, Any], codec_map: Dict[str, Any]) -> Optional[str]:
+    """None, если какой-то фичи нет в словаре - тогда строка пишется в старом формате."""
+    ids = codec_map["feature_ids"]
+    if any(name not in ids for name in features):
+        return None
+    pairs = sorted([ids[name], value] for name, value in features.items())
+    return json.dumps(pairs, separators=(",", ":"))
+
+
+def decode_features(raw: str, codec_map: Dict[str, Any]) -> Dict[str, Any]:
+    names = codec_map["features"]
+    return {names.get(fid, f"feature_{fid}"): value for fid, value in json.loads(raw)}
+
+
+def encode_matched(matched: List[str], codec_map: Dict[str, Any]) -> Optional[bytes]:
+    """Имена -> маска по id. Эвристики с одинаковым именем занимают свои id
+    по очереди; порядок после декодирования - по id."""
+    by_name = codec_map["heuristic_ids"]
+    used: Dict[str, int] = {}
+    ids = []
+    for name in matched:
+        k = used.get(name, 0)
+        if k >= len(by_name.get(name, ())):
+            return None
+        ids.append(by_name[name][k])
+        used[name] = k + 1
+    return ids_to_mask(ids)
+
+
+def decode_matched(mask: Optional[bytes], codec_map: Dict[str, Any]) -> List[str]:
+    names = codec_map["heuristics"]
+    return [names.get(hid, f"heuristic_{hid}") for hid in mask_to_ids(mask)]
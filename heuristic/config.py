@@ -0,0 +1,69 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _csv(name: str) -> frozenset:
+    return frozenset(x.strip() for x in os.getenv(name, "").split(",") if x.strip())
+
+
+class Config:
+    DB_PATH = os.getenv("FP_DB_PATH", "fp_agent.db")
+
+    # rule_id, которые не прогоняются через фичи/эвристики вообще
+    BYPASS_RULE_IDS = _csv("FP_BYPASS_RULE_IDS")
+
+    # ключ HMAC для отпечатка секрета (secret_fp); смена ключа требует
+    # пересчёта отпечатков через migrate.py --refingerprint. Значения по
+    # умолчанию нет: с известным ключом отпечатки из /classify/delta
+    # перебираются офлайн, без ключа сервис не стартует (db.init_database)
+    FINGERPRINT_KEY = os.getenv("FP_FINGERPRINT_KEY", "")
+
+    # ретеншн classifications: строки старше RETENTION_DAYS уходят в архив
+    # (0 - выключено); фоновая задача запускается раз в RETENTION_INTERVAL сек
+    RETENTION_DAYS = int(os.getenv("FP_RETENTION_DAYS", "0"))
+    RETENTION_INTERVAL = int(os.getenv("FP_RETENTION_INTERVAL", "3600"))
+    RETENTION_BATCH = int(os.getenv("FP_RETENTION_BATCH", "5000"))
+    ARCHIVE_DIR = os.getenv("FP_ARCHIVE_DIR", "archive")
+    # сколько свободных страниц возвращать ОС за один incremental_vacuum
+    VACUUM_PAGES = int(os.getenv("FP_VACUUM_PAGES", "2000"))
+
+    # размер одной выборки курсора при экспорте
+    EXPORT_FETCH_SIZE = int(os.getenv("FP_EXPORT_FETCH_SIZE", "2000"))
+
+    # как часто воркер сверяет версию конфигурации features/heuristics, сек
+    CONFIG_CHECK_INTERVAL = float(os.getenv("FP_CONFIG_CHECK_INTERVAL", "2"))
+    # сколько строк писатель сохраняет одной транзакцией
+    WRITER_BATCH = int(os.getenv("FP_WRITER_BATCH", "500"))
+    # предел очереди писателя: при переполнении запросы ждут, а не копят память
+    WRITER_QUEUE_SIZE = int(os.getenv("FP_WRITER_QUEUE_SIZE", "20000"))
+    # неудачная пачка повторяется WRITER_RETRIES раз с паузой от WRITER_RETRY_DELAY
+    # сек (удваивается), потом уходит в DEAD_LETTER_DIR (migrate.py --replay-dead-letters)
+    WRITER_RETRIES = int(os.getenv("FP_WRITER_RETRIES", "5"))
+    WRITER_RETRY_DELAY = float(os.getenv("FP_WRITER_RETRY_DELAY", "0.5"))
+    DEAD_LETTER_DIR = os.getenv("FP_DEAD_LETTER_DIR", "dead_letter")
+    # писатель без heartbeat дольше WRITER_STALE_AFTER сек считается упавшим:
+    # /classify отвечает 503, пока мастер его не перезапустит; столько же
+    # submit ждёт места в переполненной локальной очереди
+    WRITER_STALE_AFTER = float(os.getenv("FP_WRITER_STALE_AFTER", "5"))
+    WRITER_SUBMIT_TIMEOUT = float(os.getenv("FP_WRITER_SUBMIT_TIMEOUT", "10"))
+
+    # admission control для /classify (на один воркер)
+    MAX_FINDINGS_PER_REQUEST = int(os.getenv("FP_MAX_FINDINGS_PER_REQUEST", "10000"))
+    MAX_BODY_BYTES = int(os.getenv("FP_MAX_BODY_BYTES", str(32 * 1024 * 1024)))
+    # сколько находок одновременно в обработке и сколько может ждать в очереди
+    MAX_INFLIGHT_FINDINGS = int(os.getenv("FP_MAX_INFLIGHT_FINDINGS", "20000"))
+    MAX_QUEUED_FINDINGS = int(os.getenv("FP_MAX_QUEUED_FINDINGS", "100000"))
+    # сколько запрос ждёт в очереди до 429, и что вернуть в Retry-After, сек
+    ADMISSION_TIMEOUT = float(os.getenv("FP_ADMISSION_TIMEOUT", "10"))
+    RETRY_AFTER = int(os.getenv("FP_RETRY_AFTER", "5"))
+
+    # компактное хранение classifications (см. codec.py): фичи по id,
+    # эвристики битовой маской, текст длиннее COMPRESS_MIN_BYTES - zlib
+    COMPACT_STORAGE = os.getenv("FP_COMPACT_STORAGE", "1") == "1"
+    COMPRESS_MIN_BYTES = int(os.getenv("FP_COMPRESS_MIN_BYTES", "256"))
+
+    # пересчёт вердиктов по сохранённым фичам (rescore.py): строк за транзакцию
+    RESCORE_CHUNK = int(os.getenv("FP_RESCORE_CHUNK", "5000"))
@@ -1,14 +1,78 @@
 #для динамического хранения ключей/фич
+import hashlib
+import hmac
+import math
 import sqlite3
 from pathlib import Path
 import json 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-DB_PATH = Path("fp_agent.db")
+from config import Config
+import codec
+
+DB_PATH = Path(Config.DB_PATH)
+
+INDEXES = {
+    "idx_classifications_secret_fp": "classifications(secret_fp, id)",
+    "idx_classifications_report_id": "classifications(report_id, id)",
+    "idx_classifications_rule_id": "classifications(rule_id)",
+    "idx_classifications_created_at": "classifications(created_at)",
+}
+
+CLASSIFICATION_COLUMNS = [
+    "id", "report_id", "secret", "filepath", "rule_id", "entropy", "features_json",
+    "score", "verdict", "matched_heuristics", "description", "llm_used", "llm_reason",
+    "created_at", "codec_version", "matched_mask",
+]
+# служебные колонки компактного формата, наружу не отдаются
+CODEC_COLUMNS = ("codec_version", "matched_mask")
+
+# ширина корзины гистограммы score в report_score_hist
+SCORE_BUCKET = 0.5
+
+
+def connect(**kwargs) -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=30, **kwargs)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    conn.create_function("mask_any", 2, codec.mask_any, deterministic=True)
+    return conn
+
+
+def _fingerprint_key() -> bytes:
+    if not Config.FINGERPRINT_KEY:
+        raise RuntimeError("FP_FINGERPRINT_KEY не задан: без секретного ключа отпечатки секретов можно подобрать")
+    return Config.FINGERPRINT_KEY.encode()
+
+
+def fingerprint(secret: str) -> str:
+    return hmac.new(_fingerprint_key(), secret.encode(), hashlib.sha256).hexdigest()
+
+
+def finding_fingerprint(rule_id: str, filepath: str, secret: str) -> str:
+    """Отпечаток находки для delta-режима: правило + файл + секрет.
+    Номер строки не входит - он сдвигается от правок выше по файлу."""
+    msg = "\0".join((rule_id or "", filepath or "", secret)).encode()
+    return hmac.new(_fingerprint_key(), msg, hashlib.sha256).hexdigest()
+
+
+def _ensure_column(cur, table: str, column: str, ddl: str):
+    cols = [r[1] for r in cur.execute(f"PRAGMA table_info({table})")]
+    if column not in cols:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def _rule_ids(raw: Optional[str]) -> Optional[List[str]]:
+    return json.loads(raw) if raw else None
 
 
 def init_database():
-    conn = sqlite3.connect(DB_PATH)
+    # все точки входа (сервис, gunicorn, миграции) проходят здесь - падаем сразу
+    _fingerprint_key()
+    conn = connect()
+    # действует только для новой базы; существующую переводит retention.py --convert
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    # WAL: чтение и фоновые миграции не блокируют запись
+    conn.execute("PRAGMA journal_mode = WAL")
     cur = conn.cursor()
 
     cur.execute("""
@@ -18,7 +82,8 @@ def init_database():
         description TEXT,
         type TEXT NOT NULL CHECK(type IN ('builtin','keyword','regex','custom_expr')),
         config TEXT NOT NULL,  -- JSON
-        enabled BOOLEAN DEFAULT TRUE
+        enabled BOOLEAN DEFAULT TRUE,
+        rule_ids TEXT  -- JSON list; NULL = для всех правил
     );
     """)
 
@@ -28,9 +93,10 @@ def init_database():
         id INTEGER PRIMARY KEY,
         name TEXT NOT NULL,
         description TEXT,
-        condition TEXT NOT NULL,  -- JSON: {"feature": "...", "operator": "...", "value": ...}
+        condition TEXT NOT NULL,  -- JSON: {"feature": "...", "operator": "...", "value": ...} или all/any/not, см. heuristic.py
         weight REAL DEFAULT 1.0,
-        enabled BOOLEAN DEFAULT TRUE
+        enabled BOOLEAN DEFAULT TRUE,
+        rule_ids TEXT  -- JSON list; NULL = для всех правил
     );
     """)
 
@@ -50,30 +116,138 @@ def init_database():
         description TEXT,
         llm_used BOOLEAN DEFAULT FALSE,
         llm_reason TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        secret_fp TEXT,  -- HMAC-SHA256 секрета, см. fingerprint()
+        codec_version INTEGER,  -- NULL = старый JSON-формат, иначе версия codec_map
+        matched_mask BLOB  -- битовая маска id эвристик, см. codec.py
+    );
+    """)
+
+    # id -> имя фич и эвристик на момент записи; новая версия появляется,
+    # только когда набор (id, имя) реально изменился
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS codec_map (
+        version INTEGER PRIMARY KEY,
+        features TEXT NOT NULL,  -- JSON {id: name}
+        heuristics TEXT NOT NULL,  -- JSON {id: name}
+        weights TEXT,  -- JSON {id: weight}: с какими весами считались строки этой версии
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP
     );
     """)
 
+    # агрегаты по отчёту, обновляются при каждой записи в classifications
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS report_summary (
+        report_id TEXT NOT NULL,
+        verdict TEXT NOT NULL,
+        rule_id TEXT NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (report_id, verdict, rule_id)
+    );
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS report_score_hist (
+        report_id TEXT NOT NULL,
+        bucket INTEGER NOT NULL,  -- floor(score / SCORE_BUCKET)
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (report_id, bucket)
+    );
+    """)
+
+    # версия конфигурации: триггеры увеличивают её при любом изменении
+    # features/heuristics, воркеры по ней понимают, что планы устарели
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS config_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    """)
+    cur.execute("INSERT OR IGNORE INTO config_version (id, version) VALUES (1, 0)")
+    for table in ("features", "heuristics"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE config_version SET version = version + 1 WHERE id = 1;
+            END;
+            """)
+
+    # последний известный набор находок репозитория для delta-режима;
+    # первичный ключ (repo_id, finding_fp) и есть индекс для сравнения
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS repo_baseline (
+        repo_id TEXT NOT NULL,
+        finding_fp TEXT NOT NULL,
+        report_id TEXT,
+        rule_id TEXT,
+        filepath TEXT,
+        line_number INTEGER,
+        entropy REAL,
+        features_json TEXT,
+        score REAL,
+        verdict TEXT,
+        matched_heuristics TEXT,  -- JSON list
+        description TEXT,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (repo_id, finding_fp)
+    ) WITHOUT ROWID;
+    """)
+
+    # версия baseline репозитория: растёт при каждой замене (replace_baseline)
+    # и пересчёте (rescore.py), delta-запрос сверяет её перед записью
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS repo_baseline_version (
+        repo_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    """)
+
+    # старые базы без привязки к rule_id
+    _ensure_column(cur, "features", "rule_ids", "TEXT")
+    _ensure_column(cur, "heuristics", "rule_ids", "TEXT")
+    # старые строки без отпечатка дозаполняются через migrate.py
+    _ensure_column(cur, "classifications", "secret_fp", "TEXT")
+    # старые строки остаются в JSON, перекодирует migrate.py --compact
+    _ensure_column(cur, "classifications", "codec_version", "INTEGER")
+    _ensure_column(cur, "classifications", "matched_mask", "BLOB")
+    # версии карты до появления весов: причина смены вердикта в rescore.py неизвестна
+    _ensure_column(cur, "codec_map", "weights", "TEXT")
+
+    # на пустой таблице индексы строятся мгновенно; на существующей CREATE INDEX
+    # держит блокировку записи всё построение - такие базы идут через migrate.py
+    if cur.execute("SELECT 1 FROM classifications LIMIT 1").fetchone() is None:
+        for name, target in INDEXES.items():
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+
     conn.commit()
     conn.close()
 
 
+def missing_indexes() -> List[str]:
+    conn = connect()
+    existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    conn.close()
+    return [name for name in INDEXES if name not in existing]
+
+
 def get_active_features() -> List[Dict[str, Any]]:
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect()
     cur = conn.cursor()
-    cur.execute("SELECT name, type, config FROM features WHERE enabled = 1")
+    cur.execute("SELECT name, type, config, rule_ids FROM features WHERE enabled = 1")
     rows = cur.fetchall()
     conn.close()
     return [
-        {"name": r[0], "type": r[1], "config": json.loads(r[2])}
+        {"name": r[0], "type": r[1], "config": json.loads(r[2]), "rule_ids": _rule_ids(r[3])}
         for r in rows
     ]
 
 
 def get_active_heuristics() -> List[Dict[str, Any]]:
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect()
     cur = conn.cursor()
-    cur.execute("SELECT name, description, condition, weight FROM heuristics WHERE enabled = 1")
+    cur.execute("SELECT name, description, condition, weight, rule_ids FROM heuristics WHERE enabled = 1")
     rows = cur.fetchall()
     conn.close()
     return [
@@ -81,12 +255,198 @@ def get_active_heuristics() -> List[Dict[str, Any]]:
             "name": r[0],
             "description": r[1],
             "condition": json.loads(r[2]),
-            "weight": r[3]
+            "weight": r[3],
+            "rule_ids": _rule_ids(r[4])
         }
         for r in rows
     ]
 
 
+def get_heuristic_weights() -> Dict[int, float]:
+    """{id: вес} включённых эвристик - для сравнения с весами из codec_map."""
+    conn = connect()
+    rows = conn.execute("SELECT id, weight FROM heuristics WHERE enabled = 1").fetchall()
+    conn.close()
+    return dict(rows)
+
+
+def get_config_version() -> int:
+    conn = connect()
+    row = conn.execute("SELECT version FROM config_version WHERE id = 1").fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+
+def get_journal_mode() -> str:
+    conn = connect()
+    mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    conn.close()
+    return mode
+
+
+def _score_bucket(score: float) -> int:
+    return math.floor((score or 0.0) / SCORE_BUCKET)
+
+
+def _bump_summary(cur, report_id: str, verdict: str, rule_id: str, score: float, delta: int):
+    cur.execute("""
+        INSERT INTO report_summary (report_id, verdict, rule_id, n) VALUES (?, ?, ?, ?)
+        ON CONFLICT (report_id, verdict, rule_id) DO UPDATE SET n = n + excluded.n
+    """, (report_id or "", verdict, rule_id or "", delta))
+    cur.execute("""
+        INSERT INTO report_score_hist (report_id, bucket, n) VALUES (?, ?, ?)
+        ON CONFLICT (report_id, bucket) DO UPDATE SET n = n + excluded.n
+    """, (report_id or "", _score_bucket(score), delta))
+
+
+# версии codec_map неизменяемы, кэш на процесс
+_CODEC_MAPS: Dict[int, Dict[str, Any]] = {}
+# (config_version, карта) для записи
+_CODEC_CURRENT: Optional[tuple] = None
+
+
+def _load_codec(row) -> Dict[str, Any]:
+    version, features, heuristics, weights = row
+    return codec.build_map(
+        version,
+        {int(k): v for k, v in json.loads(features).items()},
+        {int(k): v for k, v in json.loads(heuristics).items()},
+        {int(k): v for k, v in json.loads(weights).items()} if weights else None,
+    )
+
+
+def _codec_by_version(version: int) -> Dict[str, Any]:
+    if version not in _CODEC_MAPS:
+        conn = connect()
+        row = conn.execute(
+            "SELECT version, features, heuristics, weights FROM codec_map WHERE version = ?", (version,)
+        ).fetchone()
+        conn.close()
+        _CODEC_MAPS[version] = _load_codec(row) if row else codec.build_map(version, {}, {})
+    return _CODEC_MAPS[version]
+
+
+def current_codec() -> Dict[str, Any]:
+    """Карта для записи: сверяется со снимком features/heuristics только при
+    смене config_version, при расхождении пишется новая версия codec_map.
+    Версия фиксируется своей транзакцией до того, как на неё сошлётся хоть одна
+    строка: откат записи результатов не оставит codec_version без карты.
+    Вызывать до открытия собственной транзакции записи."""
+    global _CODEC_CURRENT
+    conn = connect(isolation_level=None)
+    try:
+        # BEGIN IMMEDIATE: два процесса не запишут одну и ту же версию дважды
+        conn.execute("BEGIN IMMEDIATE")
+        config_version = conn.execute("SELECT version FROM config_version WHERE id = 1").fetchone()[0]
+        if _CODEC_CURRENT and _CODEC_CURRENT[0] == config_version:
+            conn.execute("ROLLBACK")
+            return _CODEC_CURRENT[1]
+
+        # в снимок входят и выключенные: их имена могут быть в старых результатах
+        features = json.dumps({fid: name for fid, name in conn.execute("SELECT id, name FROM features ORDER BY id")})
+        heuristics = conn.execute("SELECT id, name, weight FROM heuristics ORDER BY id").fetchall()
+        names = json.dumps({hid: name for hid, name, _ in heuristics})
+        weights = json.dumps({hid: weight for hid, _, weight in heuristics})
+        row = conn.execute(
+            "SELECT version, features, heuristics, weights FROM codec_map ORDER BY version DESC LIMIT 1"
+        ).fetchone()
+        if not row or row[1:] != (features, names, weights):
+            cur = conn.execute(
+                "INSERT INTO codec_map (features, heuristics, weights) VALUES (?, ?, ?)", (features, names, weights)
+            )
+            row = (cur.lastrowid, features, names, weights)
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    # кэши - только после commit
+    codec_map = _CODEC_MAPS.setdefault(row[0], _load_codec(row))
+    _CODEC_CURRENT = (config_version, codec_map)
+    return codec_map
+
+
+def _heuristic_ids(name: str) -> List[int]:
+    """Все id, под которыми эвристика с этим именем встречалась в любой версии."""
+    conn = connect()
+    rows = conn.execute("SELECT version, features, heuristics, weights FROM codec_map").fetchall()
+    conn.close()
+    ids = set()
+    for r in rows:
+        codec_map = _CODEC_MAPS.setdefault(r[0], _load_codec(r))
+        ids.update(codec_map["heuristic_ids"].get(name, ()))
+    return sorted(ids)
+
+
+def encode_result(features: Dict[str, Any], matched: List[str], codec_map: Optional[Dict[str, Any]]) -> tuple:
+    """-> (features_json, matched_heuristics, matched_mask, codec_version) для записи.
+    codec_map - из current_codec(). Если компактный формат выключен, карты нет
+    или что-то не нашлось в карте - старый JSON."""
+    if Config.COMPACT_STORAGE and codec_map is not None:
+        packed = codec.encode_features(features, codec_map)
+        mask = codec.encode_matched(matched, codec_map)
+        if packed is not None and mask is not None:
+            return codec.compress_text(packed), None, mask, codec_map["version"]
+    return json.dumps(features), json.dumps(matched), None, None
+
+
+def pack_text(value: Optional[str]):
+    return codec.compress_text(value) if Config.COMPACT_STORAGE else value
+
+
+def decode_features(features_json, codec_version) -> Dict[str, Any]:
+    features_json = codec.decompress_text(features_json)
+    if codec_version is None:
+        return json.loads(features_json or "{}")
+    return codec.decode_features(features_json, _codec_by_version(codec_version))
+
+
+def decode_matched(matched_heuristics, matched_mask, codec_version) -> List[str]:
+    if codec_version is None:
+        return json.loads(matched_heuristics or "[]")
+    return codec.decode_matched(matched_mask, _codec_by_version(codec_version))
+
+
+def decode_result(features_json, matched_heuristics, matched_mask, codec_version) -> tuple:
+    """Обратное к encode_result: -> (features, matched)."""
+    return (
+        decode_features(features_json, codec_version),
+        decode_matched(matched_heuristics, matched_mask, codec_version),
+    )
+
+
+def row_to_dict(row) -> Dict[str, Any]:
+    """Строка classifications (в порядке CLASSIFICATION_COLUMNS) -> dict для API."""
+    d = dict(zip(CLASSIFICATION_COLUMNS, row))
+    d["features"], d["matched_heuristics"] = decode_result(
+        d.pop("features_json"), d["matched_heuristics"], d.pop("matched_mask"), d.pop("codec_version")
+    )
+    d["secret"] = codec.decompress_text(d["secret"])
+    d["description"] = codec.decompress_text(d["description"])
+    d["llm_used"] = bool(d["llm_used"])
+    return d
+
+
+def _insert_classification(cur, row: Dict[str, Any], codec_map: Optional[Dict[str, Any]]) -> int:
+    features_json, matched_json, mask, version = encode_result(row["features"], row["matched"], codec_map)
+    cur.execute("""
+        INSERT INTO classifications (
+            report_id, secret, filepath, rule_id, entropy, features_json,
+            score, verdict, matched_heuristics, description, llm_used, llm_reason,
+            secret_fp, codec_version, matched_mask
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        row["report_id"], pack_text(row["secret"]), row["filepath"], row["rule_id"],
+        row["entropy"], features_json, row["score"], row["verdict"], matched_json,
+        pack_text(row["description"]), row.get("llm_used", False), row.get("llm_reason"),
+        fingerprint(row["secret"]), version, mask
+    ))
+    _bump_summary(cur, row["report_id"], row["verdict"], row["rule_id"], row["score"], 1)
+    return cur.lastrowid
+
+
 def save_classification(
     report_id: str,
     secret: str,
@@ -101,18 +461,236 @@ def save_classification(
     llm_used: bool = False,
     llm_reason: str = None
 ) -> int:
-    conn = sqlite3.connect(DB_PATH)
+    codec_map = current_codec() if Config.COMPACT_STORAGE else None
+    conn = connect()
     cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO classifications (
-            report_id, secret, filepath, rule_id, entropy, features_json,
-            score, verdict, matched_heuristics, description, llm_used, llm_reason
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        report_id, secret, filepath, rule_id, entropy, json.dumps(features),
-        score, verdict, json.dumps(matched), description, llm_used, llm_reason
-    ))
-    fid = cur.lastrowid
+    fid = _insert_classification(cur, {
+        "report_id": report_id, "secret": secret, "filepath": filepath, "rule_id": rule_id,
+        "entropy": entropy, "features": features, "score": score, "verdict": verdict,
+        "matched": matched, "description": description, "llm_used": llm_used,
+        "llm_reason": llm_reason,
+    }, codec_map)
     conn.commit()
     conn.close()
-    return fid
\ No newline at end of file
+    return fid
+
+
+def save_classifications(rows: List[Dict[str, Any]]) -> int:
+    """Пачка строк (ключи как у аргументов save_classification) одной транзакцией."""
+    codec_map = current_codec() if Config.COMPACT_STORAGE else None
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        for row in rows:
+            _insert_classification(cur, row, codec_map)
+        conn.commit()
+    finally:
+        # без commit close() откатывает транзакцию целиком
+        conn.close()
+    return len(rows)
+
+
+def get_secret_history(secret: str, limit: int = 50) -> List[Dict[str, Any]]:
+    """Прошлые классификации того же секрета, новые первыми (по индексу secret_fp)."""
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT id, report_id, rule_id, filepath, score, verdict, created_at
+        FROM classifications
+        WHERE secret_fp = ?
+        ORDER BY id DESC
+        LIMIT ?
+    """, (fingerprint(secret), limit))
+    rows = cur.fetchall()
+    conn.close()
+    return [
+        {
+            "id": r[0],
+            "report_id": r[1],
+            "rule_id": r[2],
+            "filepath": r[3],
+            "score": r[4],
+            "verdict": r[5],
+            "created_at": r[6]
+        }
+        for r in rows
+    ]
+
+
+def list_classifications(
+    report_id: str,
+    after_id: int = 0,
+    limit: int = 100,
+    verdict: Optional[str] = None,
+    rule_id: Optional[str] = None,
+    heuristic: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Страница результатов отчёта, keyset-пагинация по id."""
+    where = ["report_id = ?", "id > ?"]
+    params = [report_id, after_id]
+    if verdict:
+        where.append("verdict = ?")
+        params.append(verdict)
+    if rule_id:
+        where.append("rule_id = ?")
+        params.append(rule_id)
+    if heuristic:
+        # старые строки - JSON-список имён, компактные - маска по id из всех версий карты
+        where.append("""CASE WHEN codec_version IS NULL
+            THEN EXISTS (SELECT 1 FROM json_each(matched_heuristics) WHERE value = ?)
+            ELSE mask_any(matched_mask, ?) END""")
+        params.extend([heuristic, json.dumps(_heuristic_ids(heuristic))])
+    params.append(limit)
+
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT {", ".join(CLASSIFICATION_COLUMNS)}
+        FROM classifications
+        WHERE {" AND ".join(where)}
+        ORDER BY id
+        LIMIT ?
+    """, params)
+    rows = cur.fetchall()
+    conn.close()
+    return [row_to_dict(r) for r in rows]
+
+
+def get_report_summary(report_id: str) -> Dict[str, Any]:
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("SELECT verdict, rule_id, n FROM report_summary WHERE report_id = ? AND n > 0", (report_id,))
+    counts = cur.fetchall()
+    cur.execute("SELECT bucket, n FROM report_score_hist WHERE report_id = ? AND n > 0 ORDER BY bucket", (report_id,))
+    hist = cur.fetchall()
+    conn.close()
+
+    by_verdict: Dict[str, int] = {}
+    by_rule: Dict[str, Dict[str, int]] = {}
+    for verdict, rule_id, n in counts:
+        by_verdict[verdict] = by_verdict.get(verdict, 0) + n
+        by_rule.setdefault(rule_id, {})[verdict] = n
+
+    return {
+        "report_id": report_id,
+        "total": sum(by_verdict.values()),
+        "by_verdict": by_verdict,
+        "by_rule": by_rule,
+        "score_histogram": [
+            {"bucket_start": b * SCORE_BUCKET, "bucket_end": (b + 1) * SCORE_BUCKET, "count": n}
+            for b, n in hist
+        ],
+    }
+
+
+BASELINE_COLUMNS = [
+    "finding_fp", "report_id", "rule_id", "filepath", "line_number", "entropy",
+    "features_json", "score", "verdict", "matched_heuristics", "description",
+]
+
+# лимит параметров в одном запросе SQLite - 999 в старых сборках
+_IN_CHUNK = 500
+
+
+def _baseline_to_dict(row) -> Dict[str, Any]:
+    d = dict(zip(BASELINE_COLUMNS, row))
+    d["features"] = json.loads(d.pop("features_json") or "{}")
+    d["matched"] = json.loads(d.pop("matched_heuristics") or "[]")
+    return d
+
+
+def get_baseline(repo_id: str, fps: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Строки baseline по отпечаткам: поиск по первичному ключу, O(len(fps) log n)."""
+    conn = connect()
+    cur = conn.cursor()
+    found = {}
+    for i in range(0, len(fps), _IN_CHUNK):
+        chunk = fps[i:i + _IN_CHUNK]
+        cur.execute(f"""
+            SELECT {", ".join(BASELINE_COLUMNS)} FROM repo_baseline
+            WHERE repo_id = ? AND finding_fp IN ({", ".join("?" * len(chunk))})
+        """, [repo_id, *chunk])
+        for r in cur.fetchall():
+            found[r[0]] = _baseline_to_dict(r)
+    conn.close()
+    return found
+
+
+def get_baseline_keys(repo_id: str) -> List[tuple]:
+    """(finding_fp, rule_id, filepath, line_number) всех находок baseline репозитория."""
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT finding_fp, rule_id, filepath, line_number FROM repo_baseline WHERE repo_id = ?",
+        (repo_id,)
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+class BaselineConflict(Exception):
+    """baseline репозитория заменили после того, как delta-запрос его прочитал."""
+
+
+def get_baseline_version(repo_id: str) -> int:
+    conn = connect()
+    row = conn.execute("SELECT version FROM repo_baseline_version WHERE repo_id = ?", (repo_id,)).fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+
+def bump_baseline_version(cur, repo_id: str):
+    cur.execute("""
+        INSERT INTO repo_baseline_version (repo_id, version) VALUES (?, 1)
+        ON CONFLICT (repo_id) DO UPDATE SET version = version + 1
+    """, (repo_id,))
+
+
+def replace_baseline(repo_id: str, rows: List[Dict[str, Any]], resolved: List[str], version: int):
+    """Делает текущий отчёт новым baseline: пропавшие находки удаляются,
+    остальные вставляются/обновляются. Одна транзакция; BaselineConflict,
+    если версия baseline уже не та, что была прочитана для сравнения (version).
+
+    Пишет напрямую, а не через writer.py: запрос должен узнать о конфликте
+    до ответа, а очередь писателя асинхронная. Транзакция короткая (строки
+    одного отчёта), BEGIN IMMEDIATE ждёт писателя по busy_timeout."""
+    conn = connect(isolation_level=None)
+    try:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        row = cur.execute("SELECT version FROM repo_baseline_version WHERE repo_id = ?", (repo_id,)).fetchone()
+        if (row[0] if row else 0) != version:
+            raise BaselineConflict(f"baseline {repo_id} изменился во время запроса")
+        cur.executemany(
+            "DELETE FROM repo_baseline WHERE repo_id = ? AND finding_fp = ?",
+            [(repo_id, fp) for fp in resolved]
+        )
+        cur.executemany("""
+            INSERT INTO repo_baseline (
+                repo_id, finding_fp, report_id, rule_id, filepath, line_number, entropy,
+                features_json, score, verdict, matched_heuristics, description, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (repo_id, finding_fp) DO UPDATE SET
+                report_id = excluded.report_id,
+                line_number = excluded.line_number,
+                entropy = excluded.entropy,
+                features_json = excluded.features_json,
+                score = excluded.score,
+                verdict = excluded.verdict,
+                matched_heuristics = excluded.matched_heuristics,
+                description = excluded.description,
+                updated_at = excluded.updated_at
+        """, [
+            (
+                repo_id, r["finding_fp"], r["report_id"], r["rule_id"], r["filepath"], r["line_number"],
+                r["entropy"], json.dumps(r["features"]), r["score"], r["verdict"],
+                json.dumps(r["matched"]), r["description"]
+            )
+            for r in rows
+        ])
+        bump_baseline_version(cur, repo_id)
+        cur.execute("COMMIT")
+    finally:
+        # без COMMIT close() откатывает транзакцию
+        conn.close()
@@ -0,0 +1,50 @@
+#delta-режим: сравнение отчёта с последним отчётом того же репозитория
+from typing import Dict, Any, List, Tuple
+
+from db import finding_fingerprint, get_baseline, get_baseline_keys, get_baseline_version
+
+
+def diff(repo_id: str, findings) -> Tuple[int, List[str], Dict[str, Dict[str, Any]], List[Dict[str, Any]]]:
+    """-> (версия baseline, отпечатки находок по порядку, baseline-строки совпавших,
+    исправленные находки). Совпавшие ищутся по первичному ключу (repo_id, finding_fp),
+    исправленные - проходом по baseline этого репозитория: время зависит от
+    размера отчётов, а не всей истории. Версия читается первой: если baseline
+    заменят, пока он читается, replace_baseline это заметит."""
+    version = get_baseline_version(repo_id)
+    fps = [finding_fingerprint(f.rule_id, f.filepath, f.secret) for f in findings]
+    current = set(fps)
+    prior = get_baseline(repo_id, list(current))
+    resolved = [
+        {"fingerprint": fp, "rule_id": rule_id, "filepath": filepath, "line_number": line_number}
+        for fp, rule_id, filepath, line_number in get_baseline_keys(repo_id)
+        if fp not in current
+    ]
+    return version, fps, prior, resolved
+
+
+def carry_forward(prior: Dict[str, Any]) -> Dict[str, Any]:
+    """Результат классификации для неизменившейся находки из её baseline-строки."""
+    return {
+        "features": prior["features"],
+        "entropy": prior["entropy"],
+        "score": prior["score"],
+        "verdict": prior["verdict"],
+        "matched": prior["matched"],
+        "description": prior["description"],
+        "llm_used": False,
+        "llm_reason": None,
+    }
+
+
+def baseline_rows(findings, fps: List[str], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    rows = {}
+    for f, fp, res in zip(findings, fps, results):
+        rows[fp] = {
+            "finding_fp": fp,
+            "report_id": f.report_id,
+            "rule_id": f.rule_id,
+            "filepath": f.filepath,
+            "line_number": f.line_number,
+            **res,
+        }
+    return list(rows.values())
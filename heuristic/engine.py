@@ -1,7 +1,7 @@
 import math
 import re
 from collections import Counter
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 #оценка по теореме Шеннона
 def shannon_entropy(s: str) -> float:
@@ -33,59 +33,113 @@ def _safe_eval(expr: str, context: Dict[str, Any]) -> Any:
     return eval(code, {"__builtins__": {}}, allowed)
 
 
-def extract_features(
-    secret: str,
-    filepath: str,
-    context: str,
-    rule_id: str,
-    feature_configs: List[Dict[str, Any]]
-) -> Dict[str, Any]:
-    targets = {
+# относительная стоимость вычисления фичи, для ленивого режима
+FEATURE_COSTS = {
+    "builtin": 1.0,
+    "keyword": 2.0,
+    "regex": 5.0,
+    "custom_expr": 10.0,
+}
+
+BUILTIN_COSTS = {
+    "len": 0.1,
+    "unique_chars": 1.0,
+    "shannon_entropy": 3.0,
+}
+
+
+def feature_cost(cfg: Dict[str, Any]) -> float:
+    config = cfg["config"]
+    if "cost" in config:
+        return float(config["cost"])
+    if cfg["type"] == "builtin":
+        return BUILTIN_COSTS.get(config.get("function"), FEATURE_COSTS["builtin"])
+    return FEATURE_COSTS.get(cfg["type"], FEATURE_COSTS["custom_expr"])
+
+
+def build_targets(secret: str, filepath: str, context: str, rule_id: str) -> Dict[str, str]:
+    return {
         "secret": secret,
         "filepath": filepath,
         "context": context,
         "rule_id": rule_id,
     }
 
-    result = {}
-
-    for cfg in feature_configs:
-        name = cfg["name"]
-        ftype = cfg["type"]
-        config = cfg["config"]
-
-        try:
-            if ftype == "builtin":
-                func = BUILTIN_FUNCS[config["function"]]
-                val = targets[config["target"]]
-                result[name] = func(val)
-
-            elif ftype == "keyword":
-                target = targets[config["target"]]
-                kws = config["keywords"]
-                case = config.get("case_sensitive", False)
-                if not case:
-                    target = target.lower()
-                    kws = [kw.lower() for kw in kws]
-                match_sub = config.get("match_substring", True)
-                if match_sub:
-                    result[name] = any(kw in target for kw in kws)
-                else:
-                    result[name] = target in kws
-
-            elif ftype == "regex":
-                target = targets.get("secret", "")
-                result[name] = bool(re.search(config["pattern"], target))
-
-            elif ftype == "custom_expr":
-                expr = config["expr"]
-                target_name = config.get("target", "secret")
-                result[name] = _safe_eval(expr, {target_name: targets[target_name]})
-
-            else:
-                result[name] = None
-
-        except Exception:
-            result[name] = None
-
-    return result
\ No newline at end of file
+
+def feature_target(cfg: Dict[str, Any]) -> str:
+    """Какое поле находки читает фича: от него одного зависит её значение."""
+    if cfg["type"] == "regex":
+        return "secret"
+    return cfg["config"].get("target", "secret")
+
+
+class FeatureMemo:
+    """Кэш значений фич на одну пачку: одинаковые filepath/context/secret
+    у разных находок считаются один раз."""
+
+    def __init__(self):
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def compute(self, cfg: Dict[str, Any], targets: Dict[str, str]) -> Any:
+        key = (cfg["name"], targets.get(feature_target(cfg)))
+        if key in self.values:
+            self.hits += 1
+            return self.values[key]
+        self.misses += 1
+        val = self.values[key] = compute_feature(cfg, targets)
+        return val
+
+
+def compute_feature_memo(cfg: Dict[str, Any], targets: Dict[str, str], memo: Optional[FeatureMemo] = None) -> Any:
+    return memo.compute(cfg, targets) if memo is not None else compute_feature(cfg, targets)
+
+
+def compute_feature(cfg: Dict[str, Any], targets: Dict[str, str]) -> Any:
+    ftype = cfg["type"]
+    config = cfg["config"]
+
+    try:
+        if ftype == "builtin":
+            func = BUILTIN_FUNCS[config["function"]]
+            val = targets[config["target"]]
+            return func(val)
+
+        elif ftype == "keyword":
+            target = targets[config["target"]]
+            kws = config["keywords"]
+            case = config.get("case_sensitive", False)
+            if not case:
+                target = target.lower()
+                kws = [kw.lower() for kw in kws]
+            match_sub = config.get("match_substring", True)
+            if match_sub:
+                return any(kw in target for kw in kws)
+            return target in kws
+
+        elif ftype == "regex":
+            target = targets.get("secret", "")
+            return bool(re.search(config["pattern"], target))
+
+        elif ftype == "custom_expr":
+            expr = config["expr"]
+            target_name = config.get("target", "secret")
+            return _safe_eval(expr, {target_name: targets[target_name]})
+
+    except Exception:
+        return None
+
+    return None
+
+
+def extract_features(
+    secret: str,
+    filepath: str,
+    context: str,
+    rule_id: str,
+    feature_configs: List[Dict[str, Any]],
+    memo: Optional[FeatureMemo] = None
+) -> Dict[str, Any]:
+    targets = build_targets(secret, filepath, context, rule_id)
+    return {cfg["name"]: compute_feature_memo(cfg, targets, memo) for cfg in feature_configs}
@@ -0,0 +1,129 @@
+#потоковая выгрузка classifications в NDJSON/CSV, сжатая gzip
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+from typing import Iterator, Iterable, Optional
+
+from config import Config
+from db import connect, row_to_dict, CLASSIFICATION_COLUMNS, CODEC_COLUMNS
+
+FORMATS = ("ndjson", "csv")
+
+CSV_COLUMNS = [
+    c if c != "features_json" else "features"
+    for c in CLASSIFICATION_COLUMNS if c not in CODEC_COLUMNS
+]
+
+
+def iter_rows(
+    report_id: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    fetch_size: int = Config.EXPORT_FETCH_SIZE
+) -> Iterator[dict]:
+    """Строки по фильтру пачками по fetch_size из одной читающей транзакции.
+    В WAL это снимок на момент первого чтения: конкурентные записи не
+    блокируются и в выгрузку не попадают."""
+    where, params = [], []
+    if report_id:
+        where.append("report_id = ?")
+        params.append(report_id)
+    if since:
+        where.append("created_at >= ?")
+        params.append(since)
+    if until:
+        where.append("created_at < ?")
+        params.append(until)
+
+    # генератор могут продолжать из разных потоков пула, но всегда по очереди
+    conn = connect(check_same_thread=False, isolation_level=None)
+    try:
+        conn.execute("BEGIN")
+        cur = conn.execute(f"""
+            SELECT {", ".join(CLASSIFICATION_COLUMNS)}
+            FROM classifications
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY id
+        """, params)
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            for r in rows:
+                yield row_to_dict(r)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def iter_ndjson(rows: Iterable[dict]) -> Iterator[str]:
+    for r in rows:
+        yield json.dumps(r, ensure_ascii=False) + "\n"
+
+
+def iter_csv(rows: Iterable[dict]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    for r in rows:
+        r["features"] = json.dumps(r["features"], ensure_ascii=False)
+        r["matched_heuristics"] = json.dumps(r["matched_heuristics"], ensure_ascii=False)
+        writer.writerow(r)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def gzip_stream(chunks: Iterable[str], flush_bytes: int = 64 * 1024) -> Iterator[bytes]:
+    # wbits=31 - gzip-контейнер; отдаём наружу блоками не меньше flush_bytes
+    comp = zlib.compressobj(6, zlib.DEFLATED, 31)
+    pending = []
+    size = 0
+    for chunk in chunks:
+        data = comp.compress(chunk.encode("utf-8"))
+        if data:
+            pending.append(data)
+            size += len(data)
+        if size >= flush_bytes:
+            yield b"".join(pending)
+            pending, size = [], 0
+    pending.append(comp.flush())
+    yield b"".join(pending)
+
+
+def export_stream(
+    fmt: str = "ndjson",
+    report_id: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    fetch_size: int = Config.EXPORT_FETCH_SIZE
+) -> Iterator[bytes]:
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    rows = iter_rows(report_id, since, until, fetch_size)
+    lines = iter_ndjson(rows) if fmt == "ndjson" else iter_csv(rows)
+    return gzip_stream(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Выгрузка classifications (gzip NDJSON/CSV)")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--report-id")
+    parser.add_argument("--since", help="created_at >= 'YYYY-MM-DD[ HH:MM:SS]'")
+    parser.add_argument("--until", help="created_at < 'YYYY-MM-DD[ HH:MM:SS]'")
+    parser.add_argument("--fetch-size", type=int, default=Config.EXPORT_FETCH_SIZE)
+    parser.add_argument("-o", "--output", help="файл (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for block in export_stream(args.format, args.report_id, args.since, args.until, args.fetch_size):
+            out.write(block)
+    finally:
+        if args.output:
+            out.close()
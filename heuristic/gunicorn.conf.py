@@ -0,0 +1,30 @@
+# gunicorn -c gunicorn.conf.py main:app
+# несколько uvicorn-воркеров + один процесс-писатель в SQLite
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import writer  # noqa: E402
+from db import init_database  # noqa: E402
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("TIMEOUT", "120"))
+
+# воркеры видят своё количество в /topology и стартовом логе
+os.environ["FP_WORKERS"] = str(workers)
+
+
+def on_starting(server):
+    # схема и WAL создаются один раз, до воркеров; очередь писателя
+    # наследуется воркерами при fork
+    init_database()
+    writer.start_shared()
+    server.log.info(f"fp-agent: {workers} воркеров, писатель pid={writer.topology()['writer_pid']}")
+
+
+def on_exit(server):
+    writer.stop_shared()
@@ -1,34 +1,199 @@
-from typing import Dict, Any, List, Tuple
+import json
+from typing import Dict, Any, List, Tuple, Optional, Callable
+
+from engine import compute_feature_memo, feature_cost, FeatureMemo
+
+# порог суммарного веса, начиная с которого находка считается FP
+FP_THRESHOLD = 2.0
+
+OP_MAP = {
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "in": lambda a, b: a in b,
+    "not_in": lambda a, b: a not in b,
+    "between": lambda a, b: b[0] <= a <= b[1],
+}
+
+# Условие эвристики:
+#   {"feature": "entropy", "operator": "<", "value": 3.0}
+#   {"feature": "length", "operator": "between", "value": [16, 40]}
+#   {"feature": "entropy", "operator": ">", "feature_ref": "min_entropy"}  - сравнение двух фич
+#   {"all": [...]}, {"any": [...]}, {"not": {...}}
+# Неизвестное значение фичи (None) или несравнимые типы дают "неизвестно":
+# not(неизвестно) = неизвестно, эвристика срабатывает только на True.
+
+
+def verdict_for(score: float, threshold: float = FP_THRESHOLD) -> str:
+    return "fp" if score >= threshold else "review"
+
+
+def _describe(reasons: List[str]) -> str:
+    return "FP: " + "; ".join(reasons) if reasons else "Сложный случай"
+
+
+def _compile_node(cond: Dict[str, Any], pred_index: Dict[str, int], preds: List[tuple], feats: set):
+    for kind in ("all", "any"):
+        if kind in cond:
+            return (kind, [_compile_node(c, pred_index, preds, feats) for c in cond[kind]])
+    if "not" in cond:
+        return ("not", _compile_node(cond["not"], pred_index, preds, feats))
+
+    pred = (cond["feature"], cond["operator"], cond.get("value"), cond.get("feature_ref"))
+    key = json.dumps(pred, sort_keys=True, default=str)
+    if key not in pred_index:
+        pred_index[key] = len(preds)
+        preds.append(pred)
+    feats.add(pred[0])
+    if pred[3]:
+        feats.add(pred[3])
+    return ("p", pred_index[key])
+
+
+def compile_heuristics(
+    heuristic_configs: List[Dict[str, Any]],
+    feature_configs: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """Собирает условия всех эвристик в общую структуру: одинаковые
+    предикаты по фичам хранятся один раз и на находке считаются один раз.
+    С feature_configs дополнительно готовит порядок для ленивого режима."""
+    pred_index: Dict[str, int] = {}
+    preds: List[tuple] = []
+    heuristics = []
+    for h in heuristic_configs:
+        feats: set = set()
+        node = _compile_node(h["condition"], pred_index, preds, feats)
+        heuristics.append({
+            "name": h["name"],
+            "description": h["description"],
+            "weight": h["weight"],
+            "node": node,
+            "features": feats,
+        })
+
+    compiled = {"predicates": preds, "heuristics": heuristics, "lazy_order": None}
+    if feature_configs is not None:
+        by_name = {cfg["name"]: cfg for cfg in feature_configs}
+        for h in heuristics:
+            h["cost"] = sum(feature_cost(by_name[f]) for f in h["features"] if f in by_name)
+        compiled["lazy_order"] = sorted(
+            heuristics, key=lambda h: abs(h["weight"]) / max(h["cost"], 1e-6), reverse=True
+        )
+    return compiled
+
+
+def _eval_pred(pred: tuple, get_feature: Callable[[str], Any]) -> Optional[bool]:
+    feature, op, value, ref = pred
+    if op not in OP_MAP:
+        return None
+    a = get_feature(feature)
+    if a is None:
+        return None
+    if ref:
+        value = get_feature(ref)
+        if value is None:
+            return None
+    try:
+        return bool(OP_MAP[op](a, value))
+    except (TypeError, IndexError, KeyError):
+        return None
+
+
+def _eval_node(node, preds: List[tuple], cache: Dict[int, Optional[bool]], get_feature) -> Optional[bool]:
+    kind = node[0]
+    if kind == "p":
+        i = node[1]
+        if i not in cache:
+            cache[i] = _eval_pred(preds[i], get_feature)
+        return cache[i]
+    if kind == "not":
+        v = _eval_node(node[1], preds, cache, get_feature)
+        return None if v is None else not v
+
+    # all/any с коротким замыканием и тремя значениями
+    stop = kind == "any"
+    res = not stop
+    for child in node[1]:
+        v = _eval_node(child, preds, cache, get_feature)
+        if v is stop:
+            return stop
+        if v is None:
+            res = None
+    return res
+
+
+def apply_compiled(
+    features: Dict[str, Any],
+    compiled: Dict[str, Any]
+) -> Tuple[float, List[str], str]:
+    score = 0.0
+    matched = []
+    reasons = []
+    cache: Dict[int, Optional[bool]] = {}
+
+    for h in compiled["heuristics"]:
+        if _eval_node(h["node"], compiled["predicates"], cache, features.get) is True:
+            score += h["weight"]
+            matched.append(h["name"])
+            reasons.append(h["description"])
+
+    return score, matched, _describe(reasons)
 
 
 def apply_heuristics(
     features: Dict[str, Any],
     heuristic_configs: List[Dict[str, Any]]
 ) -> Tuple[float, List[str], str]:
+    return apply_compiled(features, compile_heuristics(heuristic_configs))
+
+
+def evaluate_lazy(
+    targets: Dict[str, str],
+    feature_configs: List[Dict[str, Any]],
+    compiled: Dict[str, Any],
+    threshold: float = FP_THRESHOLD,
+    memo: Optional[FeatureMemo] = None
+) -> Tuple[float, List[str], str, Dict[str, Any]]:
+    """Ленивая оценка: считаем только фичи, на которые ссылаются эвристики,
+    в порядке вес/стоимость, и останавливаемся, как только вердикт
+    уже не может измениться. compiled - из compile_heuristics(..., feature_configs).
+    Возвращает (score, matched, desc, features)."""
+    by_name = {cfg["name"]: cfg for cfg in feature_configs}
+    features = {}
+
+    def get_feature(name: str) -> Any:
+        if name not in features:
+            cfg = by_name.get(name)
+            features[name] = compute_feature_memo(cfg, targets, memo) if cfg else None
+        return features[name]
+
+    order = compiled["lazy_order"]
+    # сколько ещё можно набрать/потерять на оставшихся эвристиках
+    rem_pos = sum(h["weight"] for h in order if h["weight"] > 0)
+    rem_neg = sum(h["weight"] for h in order if h["weight"] < 0)
+
     score = 0.0
     matched = []
     reasons = []
+    cache: Dict[int, Optional[bool]] = {}
 
-    OP_MAP = {
-        "<": lambda a, b: a < b,
-        "<=": lambda a, b: a <= b,
-        ">": lambda a, b: a > b,
-        ">=": lambda a, b: a >= b,
-        "==": lambda a, b: a == b,
-        "!=": lambda a, b: a != b,
-    }
+    for h in order:
+        if score + rem_neg >= threshold or score + rem_pos < threshold:
+            break
 
-    for h in heuristic_configs:
-        cond = h["condition"]
-        feat = features.get(cond["feature"])
-        if feat is None:
-            continue
-        op = cond["operator"]
-        val = cond["value"]
-        if op in OP_MAP and OP_MAP[op](feat, val):
-            score += h["weight"]
+        w = h["weight"]
+        if w > 0:
+            rem_pos -= w
+        else:
+            rem_neg -= w
+
+        if _eval_node(h["node"], compiled["predicates"], cache, get_feature) is True:
+            score += w
             matched.append(h["name"])
             reasons.append(h["description"])
 
-    desc = "FP: " + "; ".join(reasons) if reasons else "Сложный случай"
-    return score, matched, desc
\ No newline at end of file
+    # фичи, которых нет в конфигурации, в ответ не попадают
+    return score, matched, _describe(reasons), {k: v for k, v in features.items() if k in by_name}
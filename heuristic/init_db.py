@@ -1,8 +1,6 @@
 import sqlite3
 import json
-from db import init_database  
-
-DB_PATH = "fp_agent.db"
+from db import init_database, DB_PATH
 
 FEATURES = [
     {"name": "entropy", "type": "builtin", "config": {"function": "shannon_entropy", "target": "secret"}},
@@ -37,14 +35,14 @@ def seed_db():
 
     for f in FEATURES:
         cur.execute(
-            "INSERT OR IGNORE INTO features (name, type, config) VALUES (?, ?, ?)",
-            (f["name"], f["type"], json.dumps(f["config"]))
+            "INSERT OR IGNORE INTO features (name, type, config, rule_ids) VALUES (?, ?, ?, ?)",
+            (f["name"], f["type"], json.dumps(f["config"]), json.dumps(f["rule_ids"]) if f.get("rule_ids") else None)
         )
 
     for h in HEURISTICS:
         cur.execute(
-            "INSERT OR IGNORE INTO heuristics (name, description, condition, weight) VALUES (?, ?, ?, ?)",
-            (h["name"], h["description"], json.dumps(h["condition"]), h["weight"])
+            "INSERT OR IGNORE INTO heuristics (name, description, condition, weight, rule_ids) VALUES (?, ?, ?, ?, ?)",
+            (h["name"], h["description"], json.dumps(h["condition"]), h["weight"], json.dumps(h["rule_ids"]) if h.get("rule_ids") else None)
         )
 
     conn.commit()
@@ -0,0 +1,421 @@
+#нагрузочный прогон /classify: масштабирование по числу воркеров gunicorn
+# и e2e-прогон с задержками p50/p95/p99 и сравнением с сохранённым baseline
+import argparse
+import importlib.util
+import json
+import math
+import os
+import re
+import random
+import secrets
+import shutil
+import socket
+import sqlite3
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import requests
+
+HERE = Path(__file__).resolve().parent
+# генератор SARIF; модуль называется так же, как heuristic/models.py
+SARIF_GENERATOR = HERE.parent / "Ai" / "models.py"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_findings(n: int, report_id: str = "loadtest") -> List[Dict[str, Any]]:
+    alphabet = string.ascii_letters + string.digits
+    paths = ["src/config.py", ".env", "tests/e2e/secret_test.py", "infra/bad-vars.tf"]
+    return [
+        {
+            "report_id": report_id,
+            "rule_id": random.choice(["github_pat", "aws_access_key", "jwt", "api_key"]),
+            "secret": "".join(random.choices(alphabet, k=random.randint(16, 48))),
+            "filepath": random.choice(paths),
+            "line_number": random.randint(1, 200),
+            "context": random.choice(["", "# TODO: remove", "token = ..."]),
+        }
+        for _ in range(n)
+    ]
+
+
+def _load_sarif_generator():
+    spec = importlib.util.spec_from_file_location("sarif_generator", SARIF_GENERATOR)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+_SNIPPET_SECRET = re.compile(r"^secret = '(.*)'$", re.S)
+
+
+def sarif_to_findings(sarif: Dict[str, Any], report_id: str = "loadtest") -> List[Dict[str, Any]]:
+    """Результаты SARIF -> находки для /classify. Секрет - значение из
+    сниппета вида secret = '...', иначе (PEM, PII) сниппет целиком."""
+    findings = []
+    for run in sarif["runs"]:
+        for r in run["results"]:
+            loc = r["locations"][0]["physicalLocation"]
+            snippet = loc["region"]["snippet"]["text"]
+            m = _SNIPPET_SECRET.match(snippet)
+            findings.append({
+                "report_id": report_id,
+                "rule_id": r["ruleId"],
+                "secret": m.group(1) if m else snippet,
+                "filepath": loc["artifactLocation"]["uri"],
+                "line_number": loc["region"]["startLine"],
+                "context": snippet,
+            })
+    return findings
+
+
+def parse_mix(raw: str) -> Dict[str, float]:
+    """'github_pat=3,private_key=1' -> {тип: вес}; пусто - все типы поровну."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in raw.split(","))):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class SarifSource:
+    """Пул находок из SARIF-генератора Ai/models.py, батчи выбираются из
+    пула по весам типов секретов (rule_id; no-secret - чистые файлы)."""
+
+    def __init__(self, mix: Optional[Dict[str, float]] = None, pool_size: int = 5000, report_id: str = "loadtest"):
+        gen = _load_sarif_generator()
+        # подстройка энтропии в генераторе медленная и для нагрузки не нужна
+        sarif = gen.generate_sarif_report(count=pool_size, entropy_enabled=False, leak_ratio=0.9)
+        self.pool = defaultdict(list)
+        for f in sarif_to_findings(sarif, report_id):
+            self.pool[f["rule_id"]].append(f)
+
+        self.mix = mix or {name: 1.0 for name in gen.SECRET_PATTERNS}
+        unknown = set(self.mix) - set(self.pool)
+        if unknown:
+            raise ValueError(f"нет таких типов секретов: {', '.join(sorted(unknown))}; есть: {', '.join(sorted(self.pool))}")
+        self.types = list(self.mix)
+        self.weights = [self.mix[t] for t in self.types]
+
+    def batch(self, n: int) -> List[Dict[str, Any]]:
+        return [random.choice(self.pool[t]) for t in random.choices(self.types, self.weights, k=n)]
+
+
+class Server:
+    """gunicorn с заданным числом воркеров на временной копии базы."""
+
+    def __init__(self, workers: int, workdir: str):
+        self.workers = workers
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.db_path = os.path.join(workdir, f"fp_agent_w{workers}.db")
+        self.env = {
+            **os.environ,
+            "FP_DB_PATH": self.db_path,
+            "WEB_CONCURRENCY": str(workers),
+            "BIND": f"127.0.0.1:{self.port}",
+            # база временная - одноразового ключа достаточно
+            "FP_FINGERPRINT_KEY": os.getenv("FP_FINGERPRINT_KEY") or secrets.token_hex(32),
+        }
+        self.proc = None
+
+    def __enter__(self):
+        subprocess.run([sys.executable, "init_db.py"], cwd=HERE, env=self.env, check=True, capture_output=True)
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+            cwd=HERE, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                if requests.get(self.url + "/", timeout=1).ok:
+                    return self
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise RuntimeError("сервер не поднялся за 30 сек")
+
+    def __exit__(self, *exc):
+        if self.proc is not None:
+            self.proc.terminate()
+            # писатель дописывает очередь перед выходом
+            self.proc.wait(120)
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    # nearest-rank: наименьшее значение, не меньше которого p% выборки
+    return values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))]
+
+
+def _post(session, url: str, body: Dict[str, Any]) -> Optional[str]:
+    """None при успехе, иначе код ответа/тип ошибки для счётчика ошибок."""
+    try:
+        r = session.post(url + "/classify", json=body, timeout=60)
+    except requests.RequestException as e:
+        return type(e).__name__
+    return None if r.ok else str(r.status_code)
+
+
+def _summary(stats: Dict[str, Any], latencies: List[float], errors: Counter, elapsed: float) -> Dict[str, Any]:
+    stats["elapsed"] = elapsed
+    stats["requests_per_sec"] = stats["requests"] / elapsed
+    stats["findings_per_sec"] = stats["findings"] / elapsed
+    stats["errors_by_kind"] = dict(errors)
+    stats["latency_ms"] = {
+        f"p{p}": _percentile(latencies, p) * 1000 for p in (50, 95, 99)
+    }
+    stats["latency_ms"]["max"] = max(latencies, default=0.0) * 1000
+    return stats
+
+
+def run_load(url: str, concurrency: int, duration: float, batch: int, source: Optional[SarifSource] = None) -> Dict[str, Any]:
+    """Замкнутый цикл: concurrency клиентов, каждый шлёт следующий запрос
+    сразу после ответа на предыдущий."""
+    stop_at = time.monotonic() + duration
+    lock = threading.Lock()
+    stats = {"requests": 0, "findings": 0, "errors": 0}
+    latencies: List[float] = []
+    errors = Counter()
+
+    def worker():
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            body = {"findings": source.batch(batch) if source else make_findings(batch)}
+            started = time.monotonic()
+            err = _post(session, url, body)
+            took = time.monotonic() - started
+            with lock:
+                stats["requests"] += 1
+                latencies.append(took)
+                if err is None:
+                    stats["findings"] += batch
+                else:
+                    stats["errors"] += 1
+                    errors[err] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return _summary(stats, latencies, errors, time.monotonic() - started)
+
+
+def run_rate(
+    url: str,
+    rate: float,
+    duration: float,
+    batch: int,
+    source: Optional[SarifSource] = None,
+    max_inflight: int = 64
+) -> Dict[str, Any]:
+    """Открытый цикл: запросы уходят по расписанию rate в секунду независимо
+    от ответов. Задержка считается от запланированного момента отправки,
+    так что ожидание свободного клиента (сервер не успевает) в неё входит."""
+    lock = threading.Lock()
+    stats = {"requests": 0, "findings": 0, "errors": 0}
+    latencies: List[float] = []
+    errors = Counter()
+    local = threading.local()
+
+    def send(scheduled: float, body: Dict[str, Any]):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        err = _post(local.session, url, body)
+        took = time.monotonic() - scheduled
+        with lock:
+            stats["requests"] += 1
+            latencies.append(took)
+            if err is None:
+                stats["findings"] += batch
+            else:
+                stats["errors"] += 1
+                errors[err] += 1
+
+    total = int(rate * duration)
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        for i in range(total):
+            scheduled = started + i / rate
+            body = {"findings": source.batch(batch) if source else make_findings(batch)}
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, scheduled, body)
+    return _summary(stats, latencies, errors, time.monotonic() - started)
+
+
+def scaling(worker_counts: List[int], concurrency_per_worker: int, duration: float, batch: int):
+    workdir = tempfile.mkdtemp(prefix="fp-loadtest-")
+    try:
+        base = None
+        print(f"{'workers':>8} {'findings/s':>12} {'speedup':>8} {'efficiency':>10} {'errors':>7}")
+        for n in worker_counts:
+            with Server(n, workdir) as srv:
+                # прогрев: первые запросы собирают планы и открывают соединения
+                run_load(srv.url, n, 1.0, batch)
+                st = run_load(srv.url, n * concurrency_per_worker, duration, batch)
+            base = base or st["findings_per_sec"] / n
+            speedup = st["findings_per_sec"] / base
+            print(f"{n:>8} {st['findings_per_sec']:>12.0f} {speedup:>8.2f} {speedup / n:>10.0%} {st['errors']:>7}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _db_size(db_path: str) -> int:
+    """Размер основного файла базы после переноса WAL в него: иначе
+    неперенесённые кадры WAL попадают в замер "до" и исчезают из замера "после"."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return os.path.getsize(db_path)
+
+
+def _db_rows(db_path: str, report_id: str) -> int:
+    conn = sqlite3.connect(db_path)
+    n = conn.execute("SELECT COUNT(*) FROM classifications WHERE report_id = ?", (report_id,)).fetchone()[0]
+    conn.close()
+    return n
+
+
+def e2e(
+    workers: int,
+    duration: float,
+    batch: int,
+    concurrency: int = 0,
+    rate: float = 0.0,
+    mix: Optional[Dict[str, float]] = None,
+    pool_size: int = 5000,
+    warmup: float = 2.0
+) -> Dict[str, Any]:
+    """Один прогон на свежей базе: по rate (если задан) или concurrency.
+    Рост базы меряется после остановки сервера - писатель к этому моменту
+    сохранил всю очередь."""
+    source = SarifSource(mix, pool_size, report_id="e2e")
+    workdir = tempfile.mkdtemp(prefix="fp-loadtest-")
+    try:
+        with Server(workers, workdir) as srv:
+            # прогрев на находках make_findings (report_id loadtest), в замер не входит
+            run_load(srv.url, workers, warmup, batch)
+            time.sleep(1.0)  # писатель дописывает очередь прогрева
+            size_before = _db_size(srv.db_path)
+            if rate:
+                st = run_rate(srv.url, rate, duration, batch, source, max_inflight=max(concurrency, 64))
+            else:
+                st = run_load(srv.url, concurrency or workers * 4, duration, batch, source)
+        growth = _db_size(srv.db_path) - size_before
+        rows = _db_rows(srv.db_path, "e2e")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    st["db"] = {
+        "rows": rows,
+        "bytes": growth,
+        "bytes_per_finding": growth / rows if rows else 0.0,
+    }
+    st["params"] = {
+        "workers": workers, "duration": duration, "batch": batch,
+        "mode": "rate" if rate else "concurrency",
+        "rate": rate, "concurrency": 0 if rate else concurrency or workers * 4,
+        "mix": source.mix,
+    }
+    return st
+
+
+# метрика -> True, если больше значит лучше
+BASELINE_METRICS = {
+    "findings_per_sec": True,
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "latency_ms.p99": False,
+    "error_rate": False,
+    "db.bytes_per_finding": False,
+}
+
+
+def _metric(st: Dict[str, Any], name: str) -> float:
+    if name == "error_rate":
+        return st["errors"] / st["requests"] if st["requests"] else 0.0
+    value = st
+    for part in name.split("."):
+        value = value[part]
+    return value
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """Метрики, ухудшившиеся относительно baseline больше чем на tolerance
+    (доля). Ошибки сравниваются по абсолютной доле запросов."""
+    regressions = []
+    for name, higher_is_better in BASELINE_METRICS.items():
+        cur, base = _metric(current, name), _metric(baseline, name)
+        if name == "error_rate":
+            worse = cur - base > tolerance / 10
+        elif higher_is_better:
+            worse = cur < base * (1 - tolerance)
+        else:
+            worse = cur > base * (1 + tolerance)
+        if worse:
+            regressions.append({"metric": name, "baseline": base, "current": cur})
+    return regressions
+
+
+def report(st: Dict[str, Any]):
+    lat = st["latency_ms"]
+    print(f"запросов: {st['requests']} ({st['requests_per_sec']:.1f}/с), находок/с: {st['findings_per_sec']:.0f}")
+    print(f"задержка, мс: p50 {lat['p50']:.1f}  p95 {lat['p95']:.1f}  p99 {lat['p99']:.1f}  max {lat['max']:.1f}")
+    print(f"ошибки: {st['errors']} {st['errors_by_kind'] or ''}")
+    print(f"рост базы: {st['db']['rows']} строк, {st['db']['bytes'] / 1024:.0f} КиБ "
+          f"({st['db']['bytes_per_finding']:.0f} байт/находка)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочные прогоны /classify")
+    parser.add_argument("--workers", default="1,2,4", help="список числа воркеров через запятую (в --e2e берётся первое)")
+    parser.add_argument("--concurrency", type=int, default=4, help="параллельных клиентов на воркер; в --e2e - всего")
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность прогона, сек")
+    parser.add_argument("--batch", type=int, default=50, help="находок в одном запросе")
+    parser.add_argument("--e2e", action="store_true", help="один прогон на SARIF-находках с задержками и ростом базы")
+    parser.add_argument("--rate", type=float, default=0.0, help="--e2e: запросов в секунду (открытый цикл) вместо --concurrency")
+    parser.add_argument("--mix", default="", help="--e2e: веса типов секретов, напр. github_pat=3,private_key=1,no-secret=1")
+    parser.add_argument("--pool", type=int, default=5000, help="--e2e: размер пула SARIF-находок")
+    parser.add_argument("--save-baseline", help="--e2e: сохранить результат в JSON")
+    parser.add_argument("--baseline", help="--e2e: сравнить с сохранённым результатом, код выхода 1 при регрессии")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="допустимое ухудшение относительно baseline, доля")
+    args = parser.parse_args()
+
+    if not args.e2e:
+        scaling([int(x) for x in args.workers.split(",")], args.concurrency, args.duration, args.batch)
+        sys.exit(0)
+
+    st = e2e(
+        int(args.workers.split(",")[0]), args.duration, args.batch,
+        concurrency=args.concurrency, rate=args.rate, mix=parse_mix(args.mix), pool_size=args.pool
+    )
+    report(st)
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(st, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.baseline:
+        base = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if base["params"] != st["params"]:
+            print(f"внимание: параметры baseline отличаются: {base['params']}")
+        regressions = compare(st, base, args.tolerance)
+        for r in regressions:
+            print(f"РЕГРЕССИЯ {r['metric']}: {r['baseline']:.2f} -> {r['current']:.2f}")
+        sys.exit(1 if regressions else 0)
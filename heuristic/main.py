@@ -1,13 +1,32 @@
-from fastapi import FastAPI, HTTPException
-from typing import List
+from fastapi import FastAPI, HTTPException, Query, Request, Response, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, JSONResponse
+from contextlib import asynccontextmanager
+from typing import List, Optional, Dict, Any, Tuple
+import asyncio
 import json
+import logging
+import os
+import weakref
 
-from db import init_database, get_active_features, get_active_heuristics, save_classification
-from engine import extract_features
-from  heuristic import apply_heuristics
+from db import (
+    init_database, get_secret_history, list_classifications, get_report_summary, get_journal_mode,
+    replace_baseline, missing_indexes, BaselineConflict
+)
+from pipeline import get_plans, classify_batch, metrics_snapshot
+from config import Config
+import retention
+import writer
+import admission
+from export import export_stream, FORMATS
+import wire
+import delta
 # from llm import llm_judge  # раскомментируем к мл-ке или подвяжем в другим способом
 
-from models import ClassifyRequest, ClassificationResult
+from models import (
+    ClassifyRequest, ClassificationResult, SecretHistoryRequest, SecretHistoryEntry,
+    ClassificationPage, ReportSummary, DeltaClassifyRequest, DeltaClassifyResponse
+)
 
 app = FastAPI(
     title="MWS AI: FP Classifier",
@@ -15,45 +34,351 @@ app = FastAPI(
     version="1.0"
 )
 
+logger = logging.getLogger(__name__)
+
+_retention_stop = None
+
+
+def topology() -> Dict[str, Any]:
+    return {
+        "pid": os.getpid(),
+        "workers": int(os.getenv("FP_WORKERS", "1")),
+        "journal_mode": get_journal_mode(),
+        **writer.topology(),
+    }
+
+
 @app.on_event("startup")
 def startup():
+    global _retention_stop
     init_database()
+    # при общем писателе ретеншн крутится в его процессе, а не в каждом воркере
+    if Config.RETENTION_DAYS > 0 and not writer.is_shared():
+        _retention_stop = retention.start_background()
+
+    topo = topology()
+    logger.info(f"topology: {topo}")
+    if topo["workers"] > 1 and not writer.is_shared():
+        logger.warning("несколько воркеров без общего писателя: запускайте через gunicorn -c gunicorn.conf.py")
+    missing = missing_indexes()
+    if missing:
+        logger.warning(f"нет индексов {', '.join(missing)}: постройте их через python migrate.py")
+    if topo["journal_mode"] != "wal":
+        logger.warning(f"journal_mode={topo['journal_mode']}: чтение будет блокировать запись")
+
+
+@app.on_event("shutdown")
+def shutdown():
+    if _retention_stop is not None:
+        _retention_stop.set()
+    writer.stop_local()
+
+class LimitBodySize:
+    """413 для тела больше MAX_BODY_BYTES. Content-Length проверяется сразу,
+    а chunked-тело считается по мере чтения: как только байт стало больше
+    лимита, чтение прекращается и запрос получает 413."""
+
+    def __init__(self, app, max_bytes: int = Config.MAX_BODY_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def _too_large(self) -> JSONResponse:
+        return JSONResponse({"detail": f"body larger than {self.max_bytes} bytes"}, status_code=413)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            return await self._too_large()(scope, receive, send)
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI пробрасывает HTTPException из чтения тела как есть
+                    raise HTTPException(413, f"body larger than {self.max_bytes} bytes")
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except HTTPException as e:
+            # тело читалось вне обработчика FastAPI (например, в другом middleware)
+            if e.status_code != 413 or started:
+                raise
+            await self._too_large()(scope, receive, send)
+
+
+app.add_middleware(LimitBodySize)
+
+
+@app.exception_handler(writer.WriterUnavailable)
+async def writer_unavailable(request: Request, exc: writer.WriterUnavailable):
+    return JSONResponse(
+        {"detail": str(exc)}, status_code=503, headers={"Retry-After": str(Config.RETRY_AFTER)}
+    )
+
+
+@app.exception_handler(BaselineConflict)
+async def baseline_conflict(request: Request, exc: BaselineConflict):
+    return JSONResponse(
+        {"detail": str(exc)}, status_code=409, headers={"Retry-After": str(Config.RETRY_AFTER)}
+    )
+
+
+def _check_size(n: int):
+    if n > Config.MAX_FINDINGS_PER_REQUEST:
+        raise HTTPException(413, f"too many findings: {n} > {Config.MAX_FINDINGS_PER_REQUEST}")
+
+
+# очередь admission ждёт в event loop; в пул потоков уходит только сама классификация
+@asynccontextmanager
+async def _admitted(n: int, priority: str):
+    _check_size(n)
+    try:
+        cost = await admission.controller.acquire(n, priority)
+    except admission.AdmissionRejected as e:
+        raise HTTPException(429, str(e), headers={"Retry-After": str(e.retry_after)})
+    try:
+        yield
+    finally:
+        await admission.controller.release(cost)
+
 
 @app.get("/")
 def index():
     return {"status": "ok", "docs": "/docs"}
 
+
+@app.get("/topology")
+def get_topology():
+    return topology()
+
+
+# счётчики текущего воркера (при нескольких воркерах - у каждого свои)
+@app.get("/metrics")
+def get_metrics():
+    return {**metrics_snapshot(), "admission": admission.controller.snapshot()}
+
+def _classify_findings(findings, explain: bool = True) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    # без живого писателя результаты некуда сохранить - отказываем до классификации
+    writer.check()
+    results, stats = classify_batch(findings, get_plans(), explain)
+
+    for f, res in zip(findings, results):
+        res["llm_used"], res["llm_reason"] = False, None
+
+        # запись асинхронная, через единственного писателя (writer.py)
+        writer.submit({
+            "report_id": f.report_id, "secret": f.secret, "filepath": f.filepath,
+            "rule_id": f.rule_id, **res
+        })
+
+    return results, stats
+
+
+def _classify_rendered(findings, explain: bool, render) -> Tuple[Any, Dict[str, Any]]:
+    results, stats = _classify_findings(findings, explain)
+    return (render(results) if render else results), stats
+
+
+async def _classify_admitted(findings, explain: bool, priority: str, render=None):
+    """render(results) выполняется в том же потоке, что и классификация: сборка
+    и сериализация ответа на тысячи находок не должна занимать event loop."""
+    async with _admitted(len(findings), priority):
+        return await run_in_threadpool(_classify_rendered, findings, explain, render)
+
+
+def _dedup_headers(stats: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "X-Dedup-Ratio": f"{stats['dedup_ratio']:.3f}",
+        "X-Distinct-Findings": str(stats["distinct"]),
+    }
+
+
 @app.post("/classify", response_model=List[ClassificationResult])
-def classify(req: ClassifyRequest):
+async def classify(req: ClassifyRequest, x_priority: str = Header("default")):
+    if not req.findings:
+        raise HTTPException(400, "findings is empty")
+
+    # ответ собирается и сериализуется в пуле потоков; возвращённый Response
+    # FastAPI не валидирует повторно, response_model остаётся для схемы
+    body, stats = await _classify_admitted(
+        req.findings, req.explain, x_priority,
+        lambda results: wire.dumps(
+            [_result_fields(f, res) for f, res in zip(req.findings, results)], wire.JSON_TYPE
+        ),
+    )
+    return Response(content=body, media_type=wire.JSON_TYPE, headers=_dedup_headers(stats))
+
+
+def _result_fields(f, res: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "secret": f.secret,
+        "entropy": round(res["entropy"], 2) if res["entropy"] is not None else None,
+        "features": res["features"],
+        "score": round(res["score"], 2),
+        "verdict": res["verdict"],
+        "matched_heuristics": res["matched"],
+        "description": res["description"],
+        "llm_used": res["llm_used"],
+        "llm_reason": res["llm_reason"],
+    }
+
+
+# один delta-запрос на репозиторий в воркере; между воркерами гонку ловит
+# проверка версии baseline в replace_baseline
+_repo_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+# столько раз delta пересчитывается, если baseline заменил параллельный запрос
+_DELTA_ATTEMPTS = 3
+
+
+def _repo_lock(repo_id: str) -> asyncio.Lock:
+    lock = _repo_locks.get(repo_id)
+    if lock is None:
+        lock = _repo_locks[repo_id] = asyncio.Lock()
+    return lock
+
+
+# классифицируются только новые находки; для неизменившихся вердикт
+# переносится из последнего отчёта репозитория, пропавшие возвращаются как resolved
+@app.post("/classify/delta", response_model=DeltaClassifyResponse)
+async def classify_delta(req: DeltaClassifyRequest, x_priority: str = Header("default")):
     if not req.findings:
         raise HTTPException(400, "findings is empty")
 
-    feat_cfg = get_active_features()
-    heur_cfg = get_active_heuristics()
-    results = []
+    # admission - на весь отчёт: diff, перенос вердиктов и baseline тоже работают
+    # по всем находкам, даже если новых среди них нет
+    async with _repo_lock(req.repo_id):
+        async with _admitted(len(req.findings), x_priority):
+            body, headers = await run_in_threadpool(_classify_delta, req)
+    return Response(content=body, media_type=wire.JSON_TYPE, headers=headers)
+
+
+def _classify_delta(req: DeltaClassifyRequest) -> Tuple[bytes, Dict[str, str]]:
+    writer.check()
+    classified: Dict[int, Dict[str, Any]] = {}
+    headers: Dict[str, str] = {}
+    for attempt in range(_DELTA_ATTEMPTS):
+        version, fps, prior, resolved = delta.diff(req.repo_id, req.findings)
+        # после конфликта заново классифицируются только ещё не классифицированные
+        todo = [i for i, fp in enumerate(fps) if fp not in prior and i not in classified]
+        if todo:
+            new_results, stats = _classify_findings([req.findings[i] for i in todo], req.explain)
+            classified.update(zip(todo, new_results))
+            headers = _dedup_headers(stats)
+
+        results = [
+            classified[i] if fp not in prior else delta.carry_forward(prior[fp])
+            for i, fp in enumerate(fps)
+        ]
+        try:
+            replace_baseline(
+                req.repo_id, delta.baseline_rows(req.findings, fps, results),
+                [r["fingerprint"] for r in resolved], version
+            )
+            break
+        except BaselineConflict:
+            logger.info(f"delta {req.repo_id}: baseline заменён параллельным запросом, попытка {attempt + 1}")
+    else:
+        raise BaselineConflict(f"baseline {req.repo_id} меняется параллельными запросами")
+
+    # перенесённые вердикты пишутся только после успешной замены baseline:
+    # при повторе после конфликта они бы задвоились
+    for i, fp in enumerate(fps):
+        if fp in prior:
+            f = req.findings[i]
+            writer.submit({
+                "report_id": f.report_id, "secret": f.secret, "filepath": f.filepath,
+                "rule_id": f.rule_id, **results[i]
+            })
 
-    for f in req.findings:
-        feats = extract_features(f.secret, f.filepath, f.context, f.rule_id, feat_cfg)
-        entropy = feats.get("entropy", 0.0)
-        score, matched, desc = apply_heuristics(feats, heur_cfg)
-        verdict = "fp" if score >= 2.0 else "review"
-        llm_used, llm_reason = False, None
+    n_new = sum(fp not in prior for fp in fps)
+    return wire.dumps({
+        "repo_id": req.repo_id,
+        "new": n_new,
+        "unchanged": len(fps) - n_new,
+        "results": [
+            {
+                **_result_fields(f, res),
+                "fingerprint": fp,
+                "status": "new" if fp not in prior else "unchanged",
+                "baseline_report_id": prior[fp]["report_id"] if fp in prior else None,
+            }
+            for f, fp, res in zip(req.findings, fps, results)
+        ],
+        "resolved": resolved,
+    }, wire.JSON_TYPE), headers
 
-        save_classification(
-            f.report_id, f.secret, f.filepath, f.rule_id, entropy, feats,
-            score, verdict, matched, desc, llm_used, llm_reason
+
+# колоночный формат (JSON или msgpack): без построчной валидации pydantic
+# и без эха секретов в ответе, результаты ссылаются на находки по индексу
+@app.post("/classify/columnar")
+async def classify_columnar(request: Request, x_priority: str = Header("default")):
+    # размер тела ограничивает LimitBodySize ещё во время чтения
+    body = await request.body()
+    # разбор тоже в пуле потоков; до admission - стоимость запроса задаёт число находок
+    try:
+        findings, options, ctype = await run_in_threadpool(
+            wire.decode_request, body, request.headers.get("content-type")
         )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    payload, stats = await _classify_admitted(
+        findings, options["explain"], x_priority,
+        lambda results: wire.dumps(wire.encode_results(results, options["with_features"]), ctype),
+    )
+    return Response(content=payload, media_type=ctype, headers=_dedup_headers(stats))
+
+# секрет передаётся в теле, а не в query, чтобы не попадать в логи доступа
+@app.post("/secrets/history", response_model=List[SecretHistoryEntry])
+def secret_history(req: SecretHistoryRequest):
+    return get_secret_history(req.secret, req.limit)
+
+
+@app.get("/reports/{report_id}/classifications", response_model=ClassificationPage)
+def report_classifications(
+    report_id: str,
+    after_id: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    verdict: Optional[str] = None,
+    rule_id: Optional[str] = None,
+    heuristic: Optional[str] = None
+):
+    items = list_classifications(report_id, after_id, limit, verdict, rule_id, heuristic)
+    next_after_id = items[-1]["id"] if len(items) == limit else None
+    return {"items": items, "next_after_id": next_after_id}
+
+
+@app.get("/reports/{report_id}/summary", response_model=ReportSummary)
+def report_summary(report_id: str):
+    return get_report_summary(report_id)
+
 
-        results.append(ClassificationResult(
-            secret=f.secret,
-            entropy=round(entropy, 2),
-            features=feats,
-            score=round(score, 2),
-            verdict=verdict,
-            matched_heuristics=matched,
-            description=desc,
-            llm_used=llm_used,
-            llm_reason=llm_reason
-        ))
-
-    return results
\ No newline at end of file
+@app.get("/classifications/export")
+def export_classifications(
+    fmt: str = Query("ndjson", alias="format"),
+    report_id: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None
+):
+    if fmt not in FORMATS:
+        raise HTTPException(400, f"format must be one of {', '.join(FORMATS)}")
+    return StreamingResponse(
+        export_stream(fmt, report_id, since, until),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="classifications.{fmt}.gz"'}
+    )
@@ -0,0 +1,172 @@
+#миграции данных classifications, которые нельзя сделать одним ALTER
+import argparse
+import json
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List
+
+import codec
+from config import Config
+from db import (
+    init_database, connect, fingerprint, _score_bucket, encode_result, current_codec, pack_text,
+    save_classifications, missing_indexes, INDEXES,
+)
+
+
+def backfill_fingerprints(batch_size: int = 1000, pause: float = 0.05, refingerprint: bool = False) -> int:
+    """Заполняет secret_fp пачками по id. Каждая пачка - отдельная короткая
+    транзакция, между ними пауза, чтобы сервис успевал писать."""
+    conn = connect()
+    cur = conn.cursor()
+    where = "" if refingerprint else "AND secret_fp IS NULL"
+    last_id = 0
+    total = 0
+
+    while True:
+        cur.execute(f"""
+            SELECT id, secret FROM classifications
+            WHERE id > ? {where}
+            ORDER BY id
+            LIMIT ?
+        """, (last_id, batch_size))
+        rows = cur.fetchall()
+        if not rows:
+            break
+
+        cur.executemany(
+            "UPDATE classifications SET secret_fp = ? WHERE id = ?",
+            [(fingerprint(codec.decompress_text(secret)), rid) for rid, secret in rows]
+        )
+        conn.commit()
+        last_id = rows[-1][0]
+        total += len(rows)
+        if pause:
+            time.sleep(pause)
+
+    conn.close()
+    return total
+
+
+def create_indexes() -> List[str]:
+    """Строит недостающие индексы classifications по одному. Каждый CREATE INDEX
+    держит блокировку записи, пока строится: писатель сервиса в это время
+    повторяет пачки (writer._save), запускать лучше в тихие часы."""
+    created = []
+    for name in missing_indexes():
+        conn = connect()
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {INDEXES[name]}")
+        conn.commit()
+        conn.close()
+        created.append(name)
+    return created
+
+
+def compact_rows(batch_size: int = 1000, pause: float = 0.05) -> int:
+    """Перекодирует строки старого JSON-формата в компактный (codec.py)
+    теми же короткими пачками. Строки, для которых в текущей карте нет
+    какой-то фичи или эвристики, остаются в JSON."""
+    conn = connect()
+    cur = conn.cursor()
+    last_id = 0
+    total = 0
+
+    while True:
+        cur.execute("""
+            SELECT id, secret, features_json, matched_heuristics, description FROM classifications
+            WHERE id > ? AND codec_version IS NULL
+            ORDER BY id
+            LIMIT ?
+        """, (last_id, batch_size))
+        rows = cur.fetchall()
+        if not rows:
+            break
+
+        codec_map = current_codec() if Config.COMPACT_STORAGE else None
+        updates = []
+        for rid, secret, features_json, matched_json, description in rows:
+            features_json, matched_json, mask, version = encode_result(
+                json.loads(features_json or "{}"), json.loads(matched_json or "[]"), codec_map
+            )
+            if version is not None:
+                updates.append((
+                    pack_text(codec.decompress_text(secret)), features_json, matched_json,
+                    mask, version, pack_text(codec.decompress_text(description)), rid
+                ))
+        cur.executemany("""
+            UPDATE classifications SET secret = ?, features_json = ?, matched_heuristics = ?,
+                matched_mask = ?, codec_version = ?, description = ?
+            WHERE id = ?
+        """, updates)
+        conn.commit()
+        last_id = rows[-1][0]
+        total += len(updates)
+        if pause:
+            time.sleep(pause)
+
+    conn.close()
+    return total
+
+
+def replay_dead_letters(dead_letter_dir: str = Config.DEAD_LETTER_DIR) -> int:
+    """Дописывает в classifications пачки, отложенные писателем (writer.dead_letter).
+    Файл удаляется только после успешной записи всей пачки."""
+    total = 0
+    for path in sorted(Path(dead_letter_dir).glob("*.ndjson")):
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        total += save_classifications(rows)
+        path.unlink()
+    return total
+
+
+def rebuild_summaries() -> int:
+    """Пересобирает report_summary/report_score_hist по всей истории.
+    Нужна один раз для строк, записанных до появления сводных таблиц."""
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM report_summary")
+    cur.execute("DELETE FROM report_score_hist")
+    cur.execute("""
+        INSERT INTO report_summary (report_id, verdict, rule_id, n)
+        SELECT COALESCE(report_id, ''), verdict, COALESCE(rule_id, ''), COUNT(*)
+        FROM classifications
+        WHERE verdict IS NOT NULL
+        GROUP BY 1, 2, 3
+    """)
+    # floor() есть не во всех сборках SQLite, корзины считаем на стороне Python
+    hist = Counter()
+    for report_id, score in conn.execute("SELECT COALESCE(report_id, ''), score FROM classifications"):
+        hist[(report_id, _score_bucket(score))] += 1
+    cur.executemany(
+        "INSERT INTO report_score_hist (report_id, bucket, n) VALUES (?, ?, ?)",
+        [(rid, b, n) for (rid, b), n in hist.items()]
+    )
+    n = cur.execute("SELECT COUNT(DISTINCT report_id) FROM report_summary").fetchone()[0]
+    conn.commit()
+    conn.close()
+    return n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Миграция данных fp_agent.db")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.05, help="пауза между пачками, сек")
+    parser.add_argument("--refingerprint", action="store_true", help="пересчитать все отпечатки (после смены ключа)")
+    parser.add_argument("--compact", action="store_true", help="перевести старые строки в компактный формат")
+    parser.add_argument("--replay-dead-letters", action="store_true", help="дописать пачки, отложенные писателем")
+    parser.add_argument("--rebuild-summaries", action="store_true", help="пересобрать агрегаты по отчётам")
+    args = parser.parse_args()
+
+    init_database()
+    n = backfill_fingerprints(args.batch_size, args.pause, args.refingerprint)
+    print(f"secret_fp: обновлено {n} строк")
+    # индексы - после бэкфилла: строить индекс по заполненной колонке дешевле,
+    # чем обновлять его на каждой строке бэкфилла
+    print(f"индексы: созданы {create_indexes() or 'нет недостающих'}")
+    if args.compact:
+        print(f"компактный формат: перекодировано {compact_rows(args.batch_size, args.pause)} строк")
+    if args.replay_dead_letters:
+        print(f"dead-letter: дописано {replay_dead_letters()} строк")
+    if args.rebuild_summaries:
+        print(f"сводки пересобраны для {rebuild_summaries()} отчётов")
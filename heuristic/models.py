@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Dict, Optional, Any
 
 
@@ -14,7 +14,7 @@ class SecretFinding(BaseModel):
 
 class ClassificationResult(BaseModel):
     secret: str
-    entropy: float
+    entropy: Optional[float] = None
     features: Dict[str, Any]
     score: float
     verdict: str  # "fp", "review"
@@ -25,4 +25,88 @@ class ClassificationResult(BaseModel):
     
 
 class ClassifyRequest(BaseModel):
-    findings: List[SecretFinding]
\ No newline at end of file
+    findings: List[SecretFinding]
+    # False - ленивый режим: считаются только нужные фичи, оценка
+    # прекращается, как только вердикт определён
+    explain: bool = True
+
+
+class SecretHistoryRequest(BaseModel):
+    secret: str
+    limit: int = Field(50, ge=1, le=1000)
+
+
+class SecretHistoryEntry(BaseModel):
+    id: int
+    report_id: Optional[str] = None
+    rule_id: Optional[str] = None
+    filepath: Optional[str] = None
+    score: Optional[float] = None
+    verdict: Optional[str] = None
+    created_at: Optional[str] = None
+
+
+class StoredClassification(BaseModel):
+    id: int
+    report_id: Optional[str] = None
+    secret: str
+    filepath: Optional[str] = None
+    rule_id: Optional[str] = None
+    entropy: Optional[float] = None
+    features: Dict[str, Any]
+    score: Optional[float] = None
+    verdict: Optional[str] = None
+    matched_heuristics: List[str]
+    description: Optional[str] = None
+    llm_used: bool = False
+    llm_reason: Optional[str] = None
+    created_at: Optional[str] = None
+
+
+class ClassificationPage(BaseModel):
+    items: List[StoredClassification]
+    # передать как after_id, чтобы получить следующую страницу; None - страниц больше нет
+    next_after_id: Optional[int] = None
+
+
+class ScoreBucket(BaseModel):
+    bucket_start: float
+    bucket_end: float
+    count: int
+
+
+class ReportSummary(BaseModel):
+    report_id: str
+    total: int
+    by_verdict: Dict[str, int]
+    by_rule: Dict[str, Dict[str, int]]
+    score_histogram: List[ScoreBucket]
+
+
+class DeltaClassifyRequest(BaseModel):
+    # репозиторий/ветка, с последним отчётом которого сравнивается этот
+    repo_id: str
+    findings: List[SecretFinding]
+    explain: bool = True
+
+
+class DeltaResult(ClassificationResult):
+    fingerprint: str
+    status: str  # "new", "unchanged"
+    # для unchanged - отчёт, из которого перенесён вердикт
+    baseline_report_id: Optional[str] = None
+
+
+class ResolvedFinding(BaseModel):
+    fingerprint: str
+    rule_id: Optional[str] = None
+    filepath: Optional[str] = None
+    line_number: Optional[int] = None
+
+
+class DeltaClassifyResponse(BaseModel):
+    repo_id: str
+    new: int
+    unchanged: int
+    results: List[DeltaResult]
+    resolved: List[ResolvedFinding]
@@ -0,0 +1,152 @@
+#планы оценки по rule_id: какие фичи и эвристики относятся к находке
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import Config
+from db import get_active_features, get_active_heuristics, get_config_version
+from engine import extract_features, build_targets, FeatureMemo
+from heuristic import compile_heuristics, apply_compiled, evaluate_lazy, verdict_for
+
+BYPASS_DESCRIPTION = "Правило исключено из анализа"
+
+
+def _in_scope(cfg: Dict[str, Any], rule_id: Optional[str]) -> bool:
+    scope = cfg.get("rule_ids")
+    return not scope or rule_id in scope
+
+
+def _plan(feature_configs, heuristic_configs, rule_id: Optional[str]) -> Dict[str, Any]:
+    features = [f for f in feature_configs if _in_scope(f, rule_id)]
+    heuristics = [h for h in heuristic_configs if _in_scope(h, rule_id)]
+    return {
+        "features": features,
+        "heuristics": heuristics,
+        "compiled": compile_heuristics(heuristics, features),
+    }
+
+
+def build_plans(
+    feature_configs: List[Dict[str, Any]],
+    heuristic_configs: List[Dict[str, Any]]
+) -> Dict[Optional[str], Dict[str, Any]]:
+    """Планы по rule_id, упомянутым в конфигурации; под ключом None -
+    план только из глобальных фич/эвристик для всех остальных правил."""
+    rule_ids = set()
+    for cfg in feature_configs + heuristic_configs:
+        rule_ids.update(cfg.get("rule_ids") or ())
+
+    plans = {rid: _plan(feature_configs, heuristic_configs, rid) for rid in rule_ids}
+    plans[None] = _plan(feature_configs, heuristic_configs, None)
+    return plans
+
+
+_cache = {"plans": None, "version": None, "checked_at": 0.0}
+_cache_lock = threading.Lock()
+
+
+def get_plans() -> Dict[Optional[str], Dict[str, Any]]:
+    """Скомпилированные планы текущего процесса. Версия конфигурации
+    сверяется не чаще раза в CONFIG_CHECK_INTERVAL, планы пересобираются
+    только если она изменилась (в этом или любом другом воркере)."""
+    now = time.monotonic()
+    if _cache["plans"] is not None and now - _cache["checked_at"] < Config.CONFIG_CHECK_INTERVAL:
+        return _cache["plans"]
+
+    with _cache_lock:
+        if _cache["plans"] is not None and now - _cache["checked_at"] < Config.CONFIG_CHECK_INTERVAL:
+            return _cache["plans"]
+        version = get_config_version()
+        if _cache["plans"] is None or version != _cache["version"]:
+            _cache["plans"] = build_plans(get_active_features(), get_active_heuristics())
+            _cache["version"] = version
+        _cache["checked_at"] = now
+        return _cache["plans"]
+
+
+def select_plan(plans: Dict[Optional[str], Dict[str, Any]], rule_id: str) -> Dict[str, Any]:
+    return plans.get(rule_id) or plans[None]
+
+
+def classify_finding(
+    f,
+    plans: Dict[Optional[str], Dict[str, Any]],
+    explain: bool = True,
+    memo: Optional[FeatureMemo] = None
+) -> Dict[str, Any]:
+    if f.rule_id in Config.BYPASS_RULE_IDS:
+        return {
+            "features": {},
+            "entropy": None,
+            "score": 0.0,
+            "verdict": "review",
+            "matched": [],
+            "description": BYPASS_DESCRIPTION,
+        }
+
+    plan = select_plan(plans, f.rule_id)
+    if explain:
+        feats = extract_features(f.secret, f.filepath, f.context, f.rule_id, plan["features"], memo)
+        score, matched, desc = apply_compiled(feats, plan["compiled"])
+    else:
+        targets = build_targets(f.secret, f.filepath, f.context, f.rule_id)
+        score, matched, desc, feats = evaluate_lazy(targets, plan["features"], plan["compiled"], memo=memo)
+
+    return {
+        "features": feats,
+        "entropy": feats.get("entropy"),
+        "score": score,
+        "verdict": verdict_for(score),
+        "matched": matched,
+        "description": desc,
+    }
+
+
+# счётчики процесса для /metrics
+METRICS = {"findings": 0, "distinct": 0, "feature_computed": 0, "feature_memo_hits": 0}
+_metrics_lock = threading.Lock()
+
+
+def _finding_key(f):
+    return (f.secret, f.filepath, f.context, f.rule_id)
+
+
+def classify_batch(
+    findings,
+    plans: Dict[Optional[str], Dict[str, Any]],
+    explain: bool = True
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Классифицирует пачку: одинаковые находки (secret, filepath, context,
+    rule_id) оцениваются один раз, фичи кэшируются по значению поля на всю
+    пачку. Результаты возвращаются в порядке findings, каждому свой dict."""
+    memo = FeatureMemo()
+    by_key: Dict[tuple, Dict[str, Any]] = {}
+    results = []
+    for f in findings:
+        key = _finding_key(f)
+        res = by_key.get(key)
+        if res is None:
+            res = by_key[key] = classify_finding(f, plans, explain, memo)
+        results.append(dict(res))
+
+    n, distinct = len(findings), len(by_key)
+    stats = {
+        "findings": n,
+        "distinct": distinct,
+        "dedup_ratio": 1 - distinct / n if n else 0.0,
+        "feature_computed": memo.misses,
+        "feature_memo_hits": memo.hits,
+    }
+    with _metrics_lock:
+        for k in METRICS:
+            METRICS[k] += stats[k]
+    return results, stats
+
+
+def metrics_snapshot() -> Dict[str, Any]:
+    with _metrics_lock:
+        m = dict(METRICS)
+    m["dedup_ratio"] = 1 - m["distinct"] / m["findings"] if m["findings"] else 0.0
+    lookups = m["feature_computed"] + m["feature_memo_hits"]
+    m["feature_memo_hit_ratio"] = m["feature_memo_hits"] / lookups if lookups else 0.0
+    return m
@@ -0,0 +1,233 @@
+#пересчёт score/verdict сохранённых classifications и repo_baseline по текущим эвристикам
+# фичи не пересчитываются: берутся из features_json как есть
+import argparse
+import json
+import time
+from collections import Counter
+from typing import Dict, Any, Optional
+
+from config import Config
+from db import (
+    init_database, connect, get_active_features, get_active_heuristics,
+    decode_features, decode_matched, encode_result, pack_text, get_heuristic_weights,
+    current_codec, bump_baseline_version, _bump_summary, _codec_by_version,
+)
+from codec import mask_to_ids
+from heuristic import FP_THRESHOLD, apply_compiled, verdict_for
+from pipeline import build_plans, select_plan
+
+
+def _required(plan: Dict[str, Any]) -> set:
+    return set().union(*(h["features"] for h in plan["compiled"]["heuristics"]))
+
+
+THRESHOLD_CAUSE = "(порог)"
+UNKNOWN_CAUSE = "(сработавшие эвристики, причина неизвестна)"
+
+
+def _flip_causes(old_verdict, new_score, old_matched, new_matched, mask, version, weights_now) -> set:
+    """Почему сменился вердикт строки. Если новый score при пороге FP_THRESHOLD
+    (с ним пишет /classify) дал бы прежний вердикт - дело только в пороге.
+    Иначе - эвристики, которые начали или перестали срабатывать, и те,
+    чей вес отличается от записанного в версии codec_map строки. Для строк
+    старого формата и версий без весов причину веса установить нельзя."""
+    if verdict_for(new_score) == old_verdict:
+        return {THRESHOLD_CAUSE}
+    causes = set(old_matched) ^ set(new_matched)
+    if version is not None:
+        codec_map = _codec_by_version(version)
+        then = codec_map["weights"]
+        if then is not None:
+            names = codec_map["heuristics"]
+            causes.update(
+                names[hid] for hid in mask_to_ids(mask)
+                if names.get(hid) in new_matched and weights_now.get(hid) != then.get(hid)
+            )
+    return causes or {UNKNOWN_CAUSE}
+
+
+def _evaluate(plans, required, evaluated: Dict[tuple, tuple], rule_id, features_json, version) -> tuple:
+    """-> (features, (score, matched, desc) или None, если каких-то фич нет).
+    Одинаковые наборы фич в пачке оцениваются один раз (evaluated)."""
+    plan = select_plan(plans, rule_id)
+    key = (id(plan), features_json, version)
+    res = evaluated.get(key)
+    if res is None:
+        features = decode_features(features_json, version)
+        if not required[id(plan)] <= features.keys():
+            res = evaluated[key] = (features, None)
+        else:
+            res = evaluated[key] = (features, apply_compiled(features, plan["compiled"]))
+    return res
+
+
+def _rescore_baseline(
+    conn, plans, required, dry_run: bool, report_id: Optional[str],
+    threshold: float, chunk_size: int, pause: float
+) -> Counter:
+    """repo_baseline хранит вердикты, которые /classify/delta переносит на
+    неизменившиеся находки: без пересчёта следующий delta-отчёт вернул бы
+    и записал заново старый вердикт. Проход по первичному ключу пачками."""
+    stats = Counter()
+    cur = conn.cursor()
+    where = "WHERE (repo_id, finding_fp) > (?, ?)" + (" AND report_id = ?" if report_id else "")
+    last = ("", "")
+
+    while True:
+        cur.execute(f"""
+            SELECT repo_id, finding_fp, rule_id, features_json, matched_heuristics, score, verdict
+            FROM repo_baseline
+            {where}
+            ORDER BY repo_id, finding_fp
+            LIMIT ?
+        """, (*last, report_id, chunk_size) if report_id else (*last, chunk_size))
+        rows = cur.fetchall()
+        if not rows:
+            break
+        last = rows[-1][:2]
+
+        evaluated: Dict[tuple, tuple] = {}
+        updates = []
+        for repo_id, fp, rule_id, features_json, matched_json, score, verdict in rows:
+            stats["rows"] += 1
+            if rule_id in Config.BYPASS_RULE_IDS:
+                stats["skipped"] += 1
+                continue
+            _, new = _evaluate(plans, required, evaluated, rule_id, features_json, None)
+            if new is None:
+                stats["incomplete"] += 1
+                continue
+
+            new_score, new_matched, desc = new
+            new_verdict = verdict_for(new_score, threshold)
+            if new_score == score and new_verdict == verdict and sorted(new_matched) == sorted(json.loads(matched_json or "[]")):
+                continue
+            stats["changed"] += 1
+            if new_verdict != verdict:
+                stats["flipped"] += 1
+            updates.append((new_score, new_verdict, json.dumps(new_matched), desc, repo_id, fp))
+
+        if updates and not dry_run:
+            cur.executemany("""
+                UPDATE repo_baseline SET score = ?, verdict = ?, matched_heuristics = ?, description = ?
+                WHERE repo_id = ? AND finding_fp = ?
+            """, updates)
+            # delta-запрос, прочитавший baseline до пересчёта, не перезапишет его
+            for repo_id in {u[4] for u in updates}:
+                bump_baseline_version(cur, repo_id)
+            conn.commit()
+            if pause:
+                time.sleep(pause)
+    return stats
+
+
+def rescore(
+    dry_run: bool = False,
+    report_id: Optional[str] = None,
+    threshold: float = FP_THRESHOLD,
+    chunk_size: int = Config.RESCORE_CHUNK,
+    pause: float = 0.0
+) -> Dict[str, Any]:
+    """Проходит classifications пачками по id и заново применяет эвристики
+    к сохранённым фичам. Изменившиеся строки и сводки по отчётам
+    обновляются одной транзакцией на пачку; в dry_run только считает.
+    Затем так же пересчитывается repo_baseline (delta-режим).
+
+    Пропускаются строки с вердиктом LLM, правила из BYPASS_RULE_IDS и строки,
+    где нет какой-то нужной фичи (записаны в ленивом режиме до того, как
+    до неё дошла очередь) - их можно пересчитать только через /classify."""
+    plans = build_plans(get_active_features(), get_active_heuristics())
+    required = {id(p): _required(p) for p in plans.values()}
+    weights_now = get_heuristic_weights()
+
+    stats = Counter()
+    # сколько вердиктов меняется из-за каждой причины, см. _flip_causes
+    by_heuristic = Counter()
+
+    where = "WHERE id > ? AND report_id = ?" if report_id else "WHERE id > ?"
+    conn = connect()
+    cur = conn.cursor()
+    last_id = 0
+
+    while True:
+        cur.execute(f"""
+            SELECT id, report_id, rule_id, features_json, matched_heuristics, matched_mask,
+                   codec_version, score, verdict, llm_used
+            FROM classifications
+            {where}
+            ORDER BY id
+            LIMIT ?
+        """, (last_id, report_id, chunk_size) if report_id else (last_id, chunk_size))
+        rows = cur.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        evaluated: Dict[tuple, tuple] = {}
+        updates = []
+        for rid, rep, rule_id, features_json, matched_json, mask, version, score, verdict, llm_used in rows:
+            stats["rows"] += 1
+            if llm_used or rule_id in Config.BYPASS_RULE_IDS:
+                stats["skipped"] += 1
+                continue
+
+            features, new = _evaluate(plans, required, evaluated, rule_id, features_json, version)
+            if new is None:
+                stats["incomplete"] += 1
+                continue
+
+            new_score, new_matched, desc = new
+            old_matched = decode_matched(matched_json, mask, version)
+            new_verdict = verdict_for(new_score, threshold)
+            if new_score == score and new_verdict == verdict and sorted(new_matched) == sorted(old_matched):
+                continue
+
+            stats["changed"] += 1
+            if new_verdict != verdict:
+                stats[f"{verdict}_to_{new_verdict}"] += 1
+                by_heuristic.update(
+                    _flip_causes(verdict, new_score, old_matched, new_matched, mask, version, weights_now)
+                )
+            updates.append((rid, rep, rule_id, score, verdict, features, new_score, new_verdict, new_matched, desc))
+
+        if updates and not dry_run:
+            # версия карты фиксируется до транзакции этой пачки
+            codec_map = current_codec() if Config.COMPACT_STORAGE else None
+            for rid, rep, rule_id, score, verdict, features, new_score, new_verdict, new_matched, desc in updates:
+                features_json, matched_json, mask, version = encode_result(features, new_matched, codec_map)
+                cur.execute("""
+                    UPDATE classifications SET score = ?, verdict = ?, features_json = ?,
+                        matched_heuristics = ?, matched_mask = ?, codec_version = ?, description = ?
+                    WHERE id = ?
+                """, (new_score, new_verdict, features_json, matched_json, mask, version, pack_text(desc), rid))
+                _bump_summary(cur, rep, verdict, rule_id, score, -1)
+                _bump_summary(cur, rep, new_verdict, rule_id, new_score, 1)
+            conn.commit()
+            if pause:
+                time.sleep(pause)
+
+    baseline = _rescore_baseline(conn, plans, required, dry_run, report_id, threshold, chunk_size, pause)
+    conn.close()
+    stats["flipped"] = stats["fp_to_review"] + stats["review_to_fp"]
+    return {
+        "dry_run": dry_run,
+        **{k: stats[k] for k in ("rows", "changed", "flipped", "fp_to_review", "review_to_fp", "skipped", "incomplete")},
+        "flips_by_heuristic": dict(by_heuristic.most_common()),
+        "baseline": {k: baseline[k] for k in ("rows", "changed", "flipped", "skipped", "incomplete")},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пересчёт вердиктов classifications по текущим эвристикам")
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать, сколько вердиктов изменится")
+    parser.add_argument("--report-id", help="только один отчёт")
+    parser.add_argument("--threshold", type=float, default=FP_THRESHOLD)
+    parser.add_argument("--chunk-size", type=int, default=Config.RESCORE_CHUNK)
+    parser.add_argument("--pause", type=float, default=0.0, help="пауза между пачками, сек")
+    args = parser.parse_args()
+
+    init_database()
+    started = time.monotonic()
+    res = rescore(args.dry_run, args.report_id, args.threshold, args.chunk_size, args.pause)
+    res["seconds"] = round(time.monotonic() - started, 2)
+    print(json.dumps(res, ensure_ascii=False, indent=2))
@@ -0,0 +1,140 @@
+#ретеншн classifications: архив старых строк в NDJSON.gz + incremental vacuum
+import argparse
+import gzip
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Any
+
+from config import Config
+from db import init_database, connect, row_to_dict, CLASSIFICATION_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+
+def _cutoff(days: int) -> str:
+    # created_at пишется SQLite как CURRENT_TIMESTAMP (UTC, 'YYYY-MM-DD HH:MM:SS')
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _write_archive(archive_dir: Path, rows) -> Path:
+    path = archive_dir / f"classifications-{rows[0][0]:012d}-{rows[-1][0]:012d}.ndjson.gz"
+    tmp = path.with_suffix(".tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8") as out:
+        for r in rows:
+            out.write(json.dumps(row_to_dict(r), ensure_ascii=False))
+            out.write("\n")
+    # файл появляется под итоговым именем только целиком
+    os.replace(tmp, path)
+    return path
+
+
+def _incremental_vacuum(conn, pages: int) -> int:
+    """Возвращает ОС до pages свободных страниц; -> сколько освобождено.
+    execute() прогоняет PRAGMA без результата только на один шаг (одна
+    страница), executescript() выполняет её до конца."""
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return before - after
+
+
+def run_retention(
+    days: int = Config.RETENTION_DAYS,
+    archive_dir: str = Config.ARCHIVE_DIR,
+    batch_size: int = Config.RETENTION_BATCH,
+    vacuum_pages: int = Config.VACUUM_PAGES
+) -> Dict[str, Any]:
+    """Переносит строки старше days дней в архив пачками по batch_size.
+    Каждая пачка: запись файла, затем DELETE в отдельной короткой транзакции,
+    так что конкурентные /classify ждут не дольше одной пачки.
+    Сводки report_summary не уменьшаются - они описывают всю историю отчёта."""
+    archive = Path(archive_dir)
+    archive.mkdir(parents=True, exist_ok=True)
+
+    conn = connect()
+    cur = conn.cursor()
+    # id растут вместе с created_at: границу ищем по индексу created_at,
+    # дальше идём по первичному ключу
+    max_id = cur.execute(
+        "SELECT MAX(id) FROM classifications WHERE created_at < ?", (_cutoff(days),)
+    ).fetchone()[0]
+
+    archived, files, vacuumed = 0, [], 0
+    last_id = 0
+    while max_id is not None:
+        cur.execute(f"""
+            SELECT {", ".join(CLASSIFICATION_COLUMNS)}
+            FROM classifications
+            WHERE id > ? AND id <= ?
+            ORDER BY id
+            LIMIT ?
+        """, (last_id, max_id, batch_size))
+        rows = cur.fetchall()
+        if not rows:
+            break
+
+        files.append(str(_write_archive(archive, rows)))
+        cur.executemany("DELETE FROM classifications WHERE id = ?", [(r[0],) for r in rows])
+        conn.commit()
+        if vacuum_pages:
+            vacuumed += _incremental_vacuum(conn, vacuum_pages)
+        last_id = rows[-1][0]
+        archived += len(rows)
+
+    free = cur.execute("PRAGMA freelist_count").fetchone()[0]
+    if archived and vacuum_pages and not vacuumed:
+        auto_vacuum = cur.execute("PRAGMA auto_vacuum").fetchone()[0]
+        logger.warning(f"retention: место не возвращено (auto_vacuum={auto_vacuum}, свободных страниц {free}); "
+                       "при auto_vacuum != 2 нужен retention.py --convert")
+    # освобождённые страницы уже в основном файле, WAL можно переиспользовать
+    cur.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+    conn.close()
+    return {"archived": archived, "files": files, "vacuumed_pages": vacuumed, "free_pages": free}
+
+
+def convert_to_incremental():
+    """Однократный перевод существующей базы на auto_vacuum=INCREMENTAL.
+    VACUUM переписывает весь файл и блокирует запись - запускать в окно обслуживания."""
+    conn = connect()
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def start_background(interval: int = Config.RETENTION_INTERVAL) -> threading.Event:
+    """Запускает ретеншн в фоновом потоке; set() у возвращённого события останавливает его."""
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                res = run_retention()
+                if res["archived"]:
+                    logger.info(f"retention: в архив {res['archived']} строк, файлов {len(res['files'])}, "
+                                f"возвращено страниц {res['vacuumed_pages']}, свободных осталось {res['free_pages']}")
+            except Exception as e:
+                logger.error(f"retention: {e}")
+
+    threading.Thread(target=loop, name="retention", daemon=True).start()
+    return stop
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Архивация старых classifications")
+    parser.add_argument("--days", type=int, default=Config.RETENTION_DAYS or 30)
+    parser.add_argument("--archive-dir", default=Config.ARCHIVE_DIR)
+    parser.add_argument("--batch-size", type=int, default=Config.RETENTION_BATCH)
+    parser.add_argument("--vacuum-pages", type=int, default=Config.VACUUM_PAGES)
+    parser.add_argument("--convert", action="store_true", help="перевести базу на auto_vacuum=INCREMENTAL (полный VACUUM)")
+    args = parser.parse_args()
+
+    init_database()
+    if args.convert:
+        convert_to_incremental()
+    res = run_retention(args.days, args.archive_dir, args.batch_size, args.vacuum_pages)
+    print(f"в архив: {res['archived']} строк, файлов: {len(res['files'])}, "
+          f"возвращено страниц: {res['vacuumed_pages']}, свободных осталось: {res['free_pages']}")
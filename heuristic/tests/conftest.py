@@ -0,0 +1,10 @@
+#тесты без FastAPI и без рабочей базы: python -m pytest heuristic/tests
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# до импорта config: DB_PATH читается один раз, рабочая fp_agent.db не трогается
+os.environ["FP_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="fp-test-"), "test.db")
+os.environ["FP_FINGERPRINT_KEY"] = "test-key"
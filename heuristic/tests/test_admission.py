@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+async def _admit_order(arrivals):
+    """Первый запрос занимает всё место; остальные встают в очередь в порядке
+    arrivals, затем место освобождается. -> порядок, в котором их пустили."""
+    controller = AdmissionController(max_inflight=1, max_queued=100, timeout=5)
+    first = await controller.acquire(1)
+    order = []
+
+    async def request(name, priority):
+        cost = await controller.acquire(1, priority)
+        order.append(name)
+        await controller.release(cost)
+
+    tasks = []
+    for name, priority in arrivals:
+        tasks.append(asyncio.create_task(request(name, priority)))
+        await asyncio.sleep(0)  # время прихода задаёт порядок внутри класса
+    assert controller.snapshot()["waiting_requests"] == len(arrivals)
+
+    await controller.release(first)
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_priority_order():
+    order = asyncio.run(_admit_order([
+        ("bulk-1", "bulk"), ("default-1", "default"), ("bulk-2", "bulk"),
+        ("interactive-1", "interactive"), ("unknown", "whatever"), ("interactive-2", "interactive"),
+    ]))
+    assert order == ["interactive-1", "interactive-2", "default-1", "unknown", "bulk-1", "bulk-2"]
+
+
+def test_queue_limit_and_timeout():
+    async def scenario():
+        controller = AdmissionController(max_inflight=2, max_queued=1, timeout=0.05)
+        cost = await controller.acquire(5)  # больше лимита - пускается в одиночку
+        assert cost == 2
+        with pytest.raises(AdmissionRejected, match="переполнена"):
+            await controller.acquire(3)
+        with pytest.raises(AdmissionRejected, match="время"):
+            await controller.acquire(1, "interactive")
+        assert controller.snapshot() == {"inflight": 2, "queued": 0, "waiting_requests": 0}
+        await controller.release(cost)
+        assert await controller.acquire(2) == 2
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        controller = AdmissionController(max_inflight=1, max_queued=10, timeout=5)
+        first = await controller.acquire(1)
+        waiter = asyncio.create_task(controller.acquire(1, "interactive"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller.snapshot() == {"inflight": 1, "queued": 0, "waiting_requests": 0}
+        await controller.release(first)
+        assert await controller.acquire(1, "bulk") == 1
+
+    asyncio.run(scenario())
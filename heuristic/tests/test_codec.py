@@ -0,0 +1,130 @@
+import json
+import sqlite3
+
+import pytest
+
+import codec
+import db
+from config import Config
+
+
+CODEC_MAP = codec.build_map(
+    1,
+    {1: "entropy", 2: "length", 5: "in_test_path"},
+    {1: "low_entropy", 3: "test_path", 4: "low_entropy", 70: "far_id"},
+)
+
+
+def test_features_round_trip():
+    features = {"length": 12, "entropy": 3.25, "in_test_path": False}
+    raw = codec.encode_features(features, CODEC_MAP)
+    assert json.loads(raw) == [[1, 3.25], [2, 12], [5, False]]
+    assert codec.decode_features(raw, CODEC_MAP) == features
+
+
+def test_unknown_feature_falls_back():
+    assert codec.encode_features({"entropy": 1.0, "new_feature": 1}, CODEC_MAP) is None
+    # id без имени в карте не теряется
+    assert codec.decode_features("[[9, 1]]", CODEC_MAP) == {"feature_9": 1}
+
+
+def test_matched_round_trip_with_duplicate_names():
+    matched = ["test_path", "low_entropy", "far_id", "low_entropy"]
+    mask = codec.encode_matched(matched, CODEC_MAP)
+    assert codec.mask_to_ids(mask) == [1, 3, 4, 70]
+    assert codec.decode_matched(mask, CODEC_MAP) == ["low_entropy", "test_path", "low_entropy", "far_id"]
+    # третьего id под этим именем в карте нет
+    assert codec.encode_matched(["low_entropy"] * 3, CODEC_MAP) is None
+
+
+def test_empty_mask():
+    mask = codec.encode_matched([], CODEC_MAP)
+    assert mask == b"\x00"
+    assert codec.decode_matched(mask, CODEC_MAP) == []
+    assert codec.decode_matched(None, CODEC_MAP) == []
+
+
+def test_mask_any():
+    mask = codec.ids_to_mask([3, 70])
+    assert codec.mask_any(mask, "[1, 70]") == 1
+    assert codec.mask_any(mask, "[1, 4]") == 0
+    assert codec.mask_any(None, "[3]") == 0
+
+
+def test_compress_text():
+    short = "короткий"
+    assert codec.compress_text(short) == short
+    long = "FP: низкая энтропия (< 3.0); " * 20
+    packed = codec.compress_text(long)
+    assert isinstance(packed, bytes) and len(packed) < len(long.encode("utf-8"))
+    assert codec.decompress_text(packed) == long
+    assert codec.compress_text(None) is None
+
+
+@pytest.fixture
+def database():
+    db.init_database()
+    conn = db.connect()
+    conn.execute("DELETE FROM classifications")
+    conn.execute(
+        "INSERT OR IGNORE INTO features (name, type, config) VALUES ('entropy', 'builtin', ?)",
+        (json.dumps({"function": "shannon_entropy", "target": "secret"}),)
+    )
+    conn.execute(
+        "INSERT INTO heuristics (name, description, condition, weight) VALUES ('low_entropy', '', ?, 2.0)",
+        (json.dumps({"feature": "entropy", "operator": "<", "value": 3.0}),)
+    )
+    conn.commit()
+    conn.close()
+
+
+def _row(**kw):
+    row = {
+        "report_id": "r1", "secret": "s" * 300, "filepath": "a.py", "rule_id": "generic",
+        "entropy": 0.0, "features": {"entropy": 0.0}, "score": 2.0, "verdict": "fp",
+        "matched": ["low_entropy"], "description": "FP: низкая энтропия" * 10,
+    }
+    row.update(kw)
+    return row
+
+
+def _stored(report_id="r1"):
+    conn = db.connect()
+    rows = conn.execute(
+        "SELECT c.codec_version, m.version FROM classifications c"
+        " LEFT JOIN codec_map m ON m.version = c.codec_version WHERE report_id = ?", (report_id,)
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def test_db_round_trip(database):
+    assert Config.COMPACT_STORAGE
+    db.save_classifications([_row()])
+    [(version, found)] = _stored()
+    assert version is not None and found == version
+
+    [item] = db.list_classifications("r1")
+    assert item["features"] == {"entropy": 0.0}
+    assert item["matched_heuristics"] == ["low_entropy"]
+    assert item["secret"] == "s" * 300
+    assert db.list_classifications("r1", heuristic="low_entropy") == [item]
+
+
+def test_rolled_back_batch_leaves_codec_map(database):
+    # новая фича - новая версия карты; пачка целиком откатывается
+    conn = db.connect()
+    conn.execute(
+        "INSERT INTO features (name, type, config) VALUES ('length', 'builtin', ?)",
+        (json.dumps({"function": "len", "target": "secret"}),)
+    )
+    conn.commit()
+    conn.close()
+    with pytest.raises(sqlite3.IntegrityError):
+        db.save_classifications([_row(report_id="r2"), _row(report_id="r2", verdict="bad")])
+    assert _stored("r2") == []
+
+    db.save_classifications([_row(report_id="r2", features={"entropy": 0.0, "length": 300})])
+    [(version, found)] = _stored("r2")
+    assert found == version
+    assert db.list_classifications("r2")[0]["features"] == {"entropy": 0.0, "length": 300}
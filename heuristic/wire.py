@@ -0,0 +1,113 @@
+#колоночный формат /classify/columnar: находки и результаты параллельными массивами
+import json
+from typing import Dict, Any, List, Tuple
+
+from models import SecretFinding
+
+try:
+    import orjson
+except ImportError:  # медленнее, но работает
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_TYPE = "application/json"
+MSGPACK_TYPE = "application/msgpack"
+
+# колонки находки: имя -> значение по умолчанию (None - обязательная)
+FINDING_COLUMNS = {
+    "report_id": None,
+    "rule_id": None,
+    "secret": None,
+    "filepath": None,
+    "line_number": 0,
+    "context": "",
+}
+
+
+def _content_type(header: str) -> str:
+    ctype = (header or JSON_TYPE).split(";")[0].strip().lower()
+    if ctype in ("application/x-msgpack", MSGPACK_TYPE):
+        if msgpack is None:
+            raise ValueError("msgpack не установлен на сервере")
+        return MSGPACK_TYPE
+    return JSON_TYPE
+
+
+def _loads(body: bytes, ctype: str) -> Any:
+    if ctype == MSGPACK_TYPE:
+        return msgpack.unpackb(body, raw=False)
+    return orjson.loads(body) if orjson else json.loads(body)
+
+
+def dumps(payload: Dict[str, Any], ctype: str) -> bytes:
+    if ctype == MSGPACK_TYPE:
+        return msgpack.packb(payload, use_bin_type=True)
+    if orjson:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_request(body: bytes, content_type: str) -> Tuple[List[SecretFinding], Dict[str, Any], str]:
+    """Тело -> (находки, опции, тип ответа). Скаляр в колонке
+    распространяется на все находки, например общий report_id."""
+    ctype = _content_type(content_type)
+    try:
+        data = _loads(body, ctype)
+    except Exception as e:
+        raise ValueError(f"Не удалось разобрать тело: {e}")
+    if not isinstance(data, dict):
+        raise ValueError("Ожидается объект с колонками")
+
+    n = None
+    for name in FINDING_COLUMNS:
+        col = data.get(name)
+        if isinstance(col, list):
+            if n is not None and len(col) != n:
+                raise ValueError(f"Колонка {name}: длина {len(col)}, ожидалась {n}")
+            n = len(col)
+    if not n:
+        raise ValueError("findings is empty")
+
+    columns = {}
+    for name, default in FINDING_COLUMNS.items():
+        col = data.get(name, default)
+        if col is None:
+            raise ValueError(f"Нет обязательной колонки {name}")
+        columns[name] = col if isinstance(col, list) else [col] * n
+        kind = int if name == "line_number" else str
+        if not all(type(v) is kind for v in columns[name]):
+            raise ValueError(f"Колонка {name}: ожидаются значения типа {kind.__name__}")
+
+    # строки уже проверены по форме, повторная валидация pydantic не нужна
+    findings = [
+        SecretFinding.model_construct(**{name: columns[name][i] for name in FINDING_COLUMNS})
+        for i in range(n)
+    ]
+    options = {
+        "explain": bool(data.get("explain", True)),
+        "with_features": bool(data.get("with_features", False)),
+    }
+    return findings, options, ctype
+
+
+def encode_results(results: List[Dict[str, Any]], with_features: bool = False) -> Dict[str, Any]:
+    """Результаты -> колонки; index[i] - позиция находки в запросе, секрет не возвращается."""
+    payload = {
+        "count": len(results),
+        "index": list(range(len(results))),
+        "verdict": [r["verdict"] for r in results],
+        "score": [round(r["score"], 2) for r in results],
+        "entropy": [round(r["entropy"], 2) if r["entropy"] is not None else None for r in results],
+        "matched_heuristics": [r["matched"] for r in results],
+        "description": [r["description"] for r in results],
+        "llm_used": [r["llm_used"] for r in results],
+        "llm_reason": [r["llm_reason"] for r in results],
+    }
+    if with_features:
+        names = sorted({k for r in results for k in r["features"]})
+        payload["features"] = {k: [r["features"].get(k) for r in results] for k in names}
+    return payload
@@ -0,0 +1,359 @@
+#единственный писатель в classifications: воркеры только ставят строки в очередь
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from config import Config
+from db import save_classifications
+
+logger = logging.getLogger(__name__)
+
+_STOP = None
+
+# процесс-писатель слушает unix-сокет; сокет создаётся в мастере gunicorn до
+# fork (см. gunicorn.conf.py), так что перезапущенный писатель принимает
+# соединения на том же адресе. У каждого воркера своё соединение: воркер,
+# убитый посреди отправки, рвёт только его, общих блокировок между процессами нет.
+# Писатель подтверждает пачку после _save, неподтверждённая пачка отправляется
+# заново - после падения писателя между commit и ответом строки задвоятся
+_listener: Optional[Listener] = None
+_address: Optional[str] = None
+# (pid, соединение) этого процесса с писателем; открывается лениво, после fork
+_channel: Optional[tuple] = None
+_shared_process: Optional[multiprocessing.Process] = None
+# в общей памяти: время последнего heartbeat писателя, его pid и число перезапусков
+_heartbeat = None
+_writer_pid = None
+_restarts = None
+_watch_stop: Optional[threading.Event] = None
+
+# в каждом процессе строки копятся в локальной очереди, поток-писатель
+# сбрасывает их пачками: в общий канал или, без него, прямо в базу
+_local_queue: Optional[queue.Queue] = None
+_local_thread: Optional[threading.Thread] = None
+_local_lock = threading.Lock()
+
+# как часто писатель отмечается в _heartbeat и мастер проверяет, жив ли он, сек
+_HEARTBEAT_INTERVAL = 1.0
+
+
+class WriterUnavailable(Exception):
+    """Писатель не отвечает или его очередь переполнена - запрос лучше повторить позже."""
+
+
+# потолок паузы между повторами, сек
+_MAX_RETRY_DELAY = 30.0
+
+
+def dead_letter(rows: List[Dict[str, Any]], dead_letter_dir: str = Config.DEAD_LETTER_DIR) -> Path:
+    """Пачка, которую не удалось сохранить, - в NDJSON-файл для migrate.py --replay-dead-letters.
+    В файлах те же данные, что и в classifications, включая секреты."""
+    out_dir = Path(dead_letter_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / f"classifications-{os.getpid()}-{time.time_ns()}.ndjson"
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as out:
+        for row in rows:
+            out.write(json.dumps(row, ensure_ascii=False, default=str))
+            out.write("\n")
+    os.replace(tmp, path)
+    return path
+
+
+def _defer(rows: List[Dict[str, Any]], error):
+    try:
+        path = dead_letter(rows)
+    except Exception as e:
+        logger.critical(f"writer: {len(rows)} строк потеряны: сохранение ({error}) и dead-letter ({e}) не удались")
+        return
+    logger.error(f"writer: {len(rows)} строк не сохранены ({error}), отложены в {path}")
+
+
+def _save(rows: List[Dict[str, Any]]):
+    # клиент уже получил ответ: строки нельзя терять молча. "database is locked"
+    # (миграция, VACUUM) обычно проходит сам - повторяем с нарастающей паузой
+    delay = Config.WRITER_RETRY_DELAY
+    for attempt in range(Config.WRITER_RETRIES + 1):
+        try:
+            save_classifications(rows)
+            return
+        except Exception as e:
+            if attempt == Config.WRITER_RETRIES:
+                error = e
+                break
+            logger.warning(f"writer: не удалось сохранить {len(rows)} строк ({e}), повтор через {delay:.1f} сек")
+            time.sleep(delay)
+            delay = min(delay * 2, _MAX_RETRY_DELAY)
+    _defer(rows, error)
+
+
+def _beat():
+    while True:
+        _heartbeat.value = time.time()
+        time.sleep(_HEARTBEAT_INTERVAL)
+
+
+def _serve(conn, inbox: queue.Queue):
+    # одно соединение - один воркер; пачки по нему идут строго по очереди
+    done = threading.Event()
+    try:
+        while True:
+            batch = conn.recv()
+            if batch is _STOP:
+                inbox.put(_STOP)
+                return
+            if not isinstance(batch, list):
+                raise ValueError(f"неожиданное сообщение {type(batch).__name__}")
+            done.clear()
+            inbox.put((batch, done))
+            done.wait()
+            conn.send(True)
+    except (EOFError, ConnectionError):
+        pass  # воркер завершился или сам закрыл соединение
+    except Exception as e:
+        # битый кадр (воркер убит посреди send): закрываем только это соединение,
+        # воркер переподключится и отправит неподтверждённую пачку заново
+        logger.error(f"writer: соединение с воркером сброшено: {e!r}")
+    finally:
+        conn.close()
+
+
+def _accept(listener: Listener, inbox: queue.Queue):
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            logger.error(f"writer: не удалось принять соединение: {e!r}")
+            time.sleep(_HEARTBEAT_INTERVAL)
+            continue
+        threading.Thread(target=_serve, args=(conn, inbox), name="fp-writer-conn", daemon=True).start()
+
+
+def _run_shared(listener: Listener, batch_size: int):
+    threading.Thread(target=_beat, name="fp-writer-heartbeat", daemon=True).start()
+    if Config.RETENTION_DAYS > 0:
+        import retention
+        retention.start_background()
+
+    inbox: queue.Queue = queue.Queue()
+    threading.Thread(target=_accept, args=(listener, inbox), name="fp-writer-accept", daemon=True).start()
+    while True:
+        item = inbox.get()
+        if item is _STOP:
+            return
+        items = [item]
+        rows = list(item[0])
+        stop = False
+        # всё, что уже пришло от других воркеров, - в ту же транзакцию
+        while len(rows) < batch_size:
+            try:
+                item = inbox.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            items.append(item)
+            rows.extend(item[0])
+        _save(rows)
+        for _, done in items:
+            done.set()
+        if stop:
+            return
+
+
+def _close_channel():
+    global _channel
+    if _channel is not None and _channel[0] == os.getpid():
+        try:
+            _channel[1].close()
+        except OSError:
+            pass
+    _channel = None
+
+
+def _deliver(rows: List[Dict[str, Any]]):
+    global _channel
+    if _channel is None or _channel[0] != os.getpid():
+        # соединение родителя, унаследованное через fork, не трогаем
+        _channel = (os.getpid(), Client(_address, family="AF_UNIX"))
+    conn = _channel[1]
+    conn.send(rows)
+    # подтверждение приходит после _save; писатель мог упасть, пока мы ждём
+    while not conn.poll(_HEARTBEAT_INTERVAL):
+        if not healthy():
+            raise ConnectionError("процесс-писатель не отвечает")
+    conn.recv()
+
+
+def _send_shared(rows: List[Dict[str, Any]]):
+    # писатель мог упасть: ждём, пока мастер его перезапустит, и отправляем
+    # пачку заново; не дождались - пачка уходит в dead-letter
+    deadline = time.monotonic() + Config.WRITER_SUBMIT_TIMEOUT
+    while True:
+        if healthy():
+            try:
+                _deliver(rows)
+                return
+            except (OSError, EOFError) as e:
+                _close_channel()
+                logger.warning(f"writer: соединение с писателем оборвалось ({e!r}), повтор")
+                deadline = time.monotonic() + Config.WRITER_SUBMIT_TIMEOUT
+        if time.monotonic() >= deadline:
+            _defer(rows, "процесс-писатель не отвечает")
+            return
+        time.sleep(_HEARTBEAT_INTERVAL)
+
+
+def _run_local(q: queue.Queue, batch_size: int):
+    while True:
+        row = q.get()
+        if row is _STOP:
+            return
+        rows = [row]
+        stop = False
+        while len(rows) < batch_size:
+            try:
+                row = q.get_nowait()
+            except queue.Empty:
+                break
+            if row is _STOP:
+                stop = True
+                break
+            rows.append(row)
+
+        if is_shared():
+            _send_shared(rows)
+        else:
+            _save(rows)
+        if stop:
+            return
+
+
+def _spawn():
+    global _shared_process
+    ctx = multiprocessing.get_context("fork")
+    _heartbeat.value = time.time()  # отсчёт до первого heartbeat нового процесса
+    _shared_process = ctx.Process(
+        target=_run_shared, args=(_listener, Config.WRITER_BATCH), name="fp-writer", daemon=True
+    )
+    _shared_process.start()
+    _writer_pid.value = _shared_process.pid
+
+
+def _exited(proc: multiprocessing.Process) -> bool:
+    # мастер gunicorn сам собирает завершившихся детей (waitpid(-1)), и тогда
+    # is_alive() их уже не видит - проверяем и наличие процесса по pid
+    if not proc.is_alive():
+        return True
+    try:
+        os.kill(proc.pid, 0)
+    except ProcessLookupError:
+        return True
+    return False
+
+
+def _watch(stop: threading.Event):
+    while not stop.wait(_HEARTBEAT_INTERVAL):
+        if _exited(_shared_process):
+            logger.error(f"writer: процесс-писатель pid={_shared_process.pid} завершился, перезапуск")
+            _spawn()
+            _restarts.value += 1
+
+
+def start_shared():
+    """Запускает процесс-писатель и поток, который перезапускает его при падении.
+    Вызывать в мастер-процессе до fork воркеров."""
+    global _listener, _address, _heartbeat, _writer_pid, _restarts, _watch_stop
+    ctx = multiprocessing.get_context("fork")
+    # каталог 0700: подключиться к писателю могут только процессы этого пользователя
+    _address = os.path.join(tempfile.mkdtemp(prefix="fp-writer-"), "writer.sock")
+    _listener = Listener(_address, family="AF_UNIX", backlog=128)
+    _heartbeat = ctx.Value("d", time.time(), lock=False)
+    _writer_pid = ctx.Value("i", 0, lock=False)
+    _restarts = ctx.Value("i", 0, lock=False)
+    _spawn()
+    _watch_stop = threading.Event()
+    threading.Thread(target=_watch, args=(_watch_stop,), name="fp-writer-watch", daemon=True).start()
+
+
+def stop_shared(timeout: float = 30.0):
+    if _shared_process is None:
+        return
+    _watch_stop.set()
+    try:
+        with Client(_address, family="AF_UNIX") as conn:
+            conn.send(_STOP)
+            _shared_process.join(timeout)
+    except OSError as e:
+        logger.error(f"writer: не удалось остановить писатель: {e!r}")
+    _listener.close()
+    shutil.rmtree(os.path.dirname(_address), ignore_errors=True)
+
+
+def _ensure_local() -> queue.Queue:
+    global _local_queue, _local_thread
+    with _local_lock:
+        if _local_thread is None or not _local_thread.is_alive():
+            _local_queue = queue.Queue(Config.WRITER_QUEUE_SIZE)
+            _local_thread = threading.Thread(
+                target=_run_local, args=(_local_queue, Config.WRITER_BATCH), name="fp-writer", daemon=True
+            )
+            _local_thread.start()
+    return _local_queue
+
+
+def is_shared() -> bool:
+    return _address is not None
+
+
+def healthy() -> bool:
+    """Общий писатель отмечался недавно; без него поток-писатель запускается по требованию."""
+    if not is_shared():
+        return True
+    return time.time() - _heartbeat.value <= Config.WRITER_STALE_AFTER
+
+
+def check():
+    if not healthy():
+        raise WriterUnavailable("процесс-писатель не отвечает")
+
+
+def submit(row: Dict[str, Any]):
+    """Ставит строку classifications в очередь писателя (ключи как у save_classification).
+    WriterUnavailable, если писатель не отвечает или очередь не освободилась за WRITER_SUBMIT_TIMEOUT."""
+    check()
+    try:
+        _ensure_local().put(row, timeout=Config.WRITER_SUBMIT_TIMEOUT)
+    except queue.Full:
+        raise WriterUnavailable("очередь писателя переполнена")
+
+
+def stop_local(timeout: float = 30.0):
+    """Сбрасывает локальную очередь (в базу или общему писателю) и останавливает поток."""
+    if _local_thread is None:
+        return
+    _local_queue.put(_STOP)
+    _local_thread.join(timeout)
+
+
+def topology() -> Dict[str, Any]:
+    topo = {
+        "writer": "shared-process" if is_shared() else "in-process-thread",
+        "writer_pid": (_writer_pid.value or None) if is_shared() else None,
+        "writer_alive": healthy(),
+        "writer_queue": _local_queue.qsize() if _local_queue is not None else 0,
+    }
+    if is_shared():
+        topo["writer_heartbeat_age"] = round(time.time() - _heartbeat.value, 1)
+        topo["writer_restarts"] = _restarts.value
+    return topo